@@ -1,65 +1,174 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+import orjson
 import uvicorn
-from fastapi import FastAPI
+from cachetools import TTLCache
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from app import RequestHandler
+from app import OptimisationDebouncer, RequestHandler, solve_day
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+# Number of uvicorn worker processes. Each worker imports this module separately, so it gets its own
+# RequestHandler/DB connections, events cache and optimisation pool
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", max(2, os.cpu_count() or 2)))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # uvloop is requested in __main__, but warn if the server was started some other way
+    loop_module = asyncio.get_running_loop().__class__.__module__
+    if not loop_module.startswith("uvloop"):
+        logger.warning("Running on %s event loop instead of uvloop", loop_module)
+
+    # ILP solves are CPU-bound, so they run in worker processes to keep the GIL free for the event loop.
+    # Workers are spawned rather than forked so they don't inherit this process's DB state
+    # The cores are shared between the uvicorn workers, so each worker's pool only gets its share of them
+    app.state.opt_pool = ProcessPoolExecutor(max_workers=max(1, ((os.cpu_count() or 2) - 1) // WEB_CONCURRENCY),
+                                             mp_context=multiprocessing.get_context("spawn"))
+    yield
+    app.state.opt_pool.shutdown(cancel_futures=True)
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 origins = [
     "http://localhost:5173",
 ]
 
+# Event lists repeat the same keys for every event, so they compress well
+app.add_middleware(GZipMiddleware, minimum_size=512, compresslevel=5)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # Explicit lists let the middleware use precomputed preflight headers, and browsers cache preflights for an hour
+    allow_methods=["GET", "POST", "PUT", "DELETE"],
+    allow_headers=["Content-Type", "If-None-Match"],
+    max_age=3600,
 )
 
+# Single request handler shared by every request (the DB/optimiser objects it holds are reusable)
+rh = RequestHandler()
+
+# Serialised GET /events responses keyed by query params and the DB's data version, as (etag, payload). While an
+# entry is fresh the Google Calendar sync is skipped. Each worker has its own cache, so the data version (bumped by
+# any worker's writes) is part of the key, and a write made through another worker is visible immediately
+events_cache = TTLCache(maxsize=128, ttl=30)
+
+
+# Event lists longer than this are streamed in chunks of STREAM_CHUNK_SIZE events
+STREAM_THRESHOLD = 500
+STREAM_CHUNK_SIZE = 100
+
+
+def stream_events_json(events: list):
+    """
+    Yields the {"events": [...]} response body a chunk of events at a time
+    :param events: Event dicts to serialise
+    :return: Generator of JSON byte chunks
+    """
+    yield b'{"events":['
+    for i in range(0, len(events), STREAM_CHUNK_SIZE):
+        chunk = b",".join(orjson.dumps(e) for e in events[i:i + STREAM_CHUNK_SIZE])
+        yield chunk if i == 0 else b"," + chunk
+    yield b"]}"
+
+
+async def optimise_day(dt: datetime) -> None:
+    # Solve in the process pool, then apply the moved events (blocking DB/Google Calendar I/O) in the threadpool
+    processed_events = await asyncio.get_running_loop().run_in_executor(app.state.opt_pool, solve_day, dt.isoformat())
+    await run_in_threadpool(rh.apply_optimised_events, processed_events)
+    events_cache.clear()
+
+optimisation_debouncer = OptimisationDebouncer(optimise_day)
+
 class EventJson(BaseModel):
     summary: str
     start_time: str
     end_time: str
-    earliest_start: str = None
-    latest_end: str = None
+    earliest_start: Optional[str] = None
+    latest_end: Optional[str] = None
     is_flexible: bool
-    duration_minutes: int = None
-    google_id: str = None
+    duration_minutes: Optional[int] = None
+    google_id: Optional[str] = None
 
 class EventList(BaseModel):
     events: list[EventJson]
 
 
 # API Endpoints
-@app.get("/events", response_model=EventList)
-def get_events(in_range: bool = False, from_date: str = "", to_date: str = ""):
-    rh = RequestHandler()
-    events = rh.get_events(in_range, from_date, to_date)
-    print(events)
-    return EventList(events=events)
-
-@app.post("/events")
-def add_event(event: EventJson):
-    rh = RequestHandler()
-    rh.add_event(event.model_dump())
-    return {"message": f"Event {event.summary} added successfully"}
-
-@app.put("/events/{google_id}")
-def edit_event(google_id: str, updated_event: EventJson):
-    print('editing event')
-    rh = RequestHandler()
-    rh.edit_event(google_id, updated_event.model_dump())
-    return {"message": f"Event {google_id} edited successfully"}
-
-
-@app.delete("/events/{google_id}")
-def delete_event(google_id: str):
-    rh = RequestHandler()
-    rh.del_event(google_id)
-    return {"message": f"Event {google_id} deleted successfully"}
+# Scheduler/DB/Google Calendar calls are blocking, so they are dispatched to the threadpool explicitly
+# Events are already plain dicts in Event.to_json form, so they are serialised directly without a response_model pass
+@app.get("/events", responses={200: {"model": EventList}})
+async def get_events(request: Request, in_range: bool = False, from_date: Optional[datetime] = None,
+                     to_date: Optional[datetime] = None):
+    # Dates are parsed and validated by FastAPI, so bad input is rejected with a 422 before reaching the handler
+    if in_range and (from_date is None or to_date is None):
+        raise HTTPException(status_code=422, detail="from_date and to_date are required when in_range is set")
+
+    # Single row primary key read, cheap enough to run on the event loop
+    cache_key = (in_range, from_date, to_date, rh.db.data_version())
+    cached = events_cache.get(cache_key)
+    if cached is None:
+        events = await run_in_threadpool(rh.get_events, in_range, from_date, to_date)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Fetched %d events", len(events))
+
+        # Large result sets are streamed rather than built into one payload, so they aren't cached or ETagged
+        if len(events) > STREAM_THRESHOLD:
+            return StreamingResponse(stream_events_json(events), media_type="application/json")
+
+        payload = orjson.dumps({"events": events})
+        cached = (f'"{hashlib.blake2b(payload, digest_size=8).hexdigest()}"', payload)
+        events_cache[cache_key] = cached
+
+    etag, payload = cached
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(payload, media_type="application/json", headers={"ETag": etag})
+
+# Write endpoints only return a message, so they skip response validation. The parsed model's field dict
+# is passed through as-is rather than copied with model_dump()
+# Adds/edits return 202 as the day's flexible events are re-optimised in the background after the response
+# (the handler returns no day when there is nothing on it to optimise)
+@app.post("/events", response_model=None, status_code=202)
+async def add_event(event: EventJson, background: BackgroundTasks):
+    optimise_dt = await run_in_threadpool(rh.add_event, event.__dict__)
+    events_cache.clear()
+    if optimise_dt is not None:
+        background.add_task(optimisation_debouncer.request, optimise_dt)
+    return ORJSONResponse({"message": f"Event {event.summary} added successfully"}, status_code=202)
+
+@app.put("/events/{google_id}", response_model=None, status_code=202)
+async def edit_event(google_id: str, updated_event: EventJson, background: BackgroundTasks):
+    logger.debug("Editing event %s", google_id)
+    optimise_dt = await run_in_threadpool(rh.edit_event, google_id, updated_event.__dict__)
+    events_cache.clear()
+    if optimise_dt is not None:
+        background.add_task(optimisation_debouncer.request, optimise_dt)
+    return ORJSONResponse({"message": f"Event {google_id} edited successfully"}, status_code=202)
+
+
+@app.delete("/events/{google_id}", response_model=None)
+async def delete_event(google_id: str):
+    await run_in_threadpool(rh.del_event, google_id)
+    events_cache.clear()
+    return ORJSONResponse({"message": f"Event {google_id} deleted successfully"})
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Multiple workers need the app as an import string, so each worker process can import it itself
+    uvicorn.run("api:app", host="0.0.0.0", port=8000, workers=WEB_CONCURRENCY, loop="uvloop", http="httptools",
+                log_level="warning")
\ No newline at end of file
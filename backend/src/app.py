@@ -1,5 +1,10 @@
+import asyncio
+import logging
 import scheduler
 from datetime import datetime
+from typing import Optional, Union
+
+logger = logging.getLogger(__name__)
 
 class RequestHandler:
     def __init__(self):
@@ -9,83 +14,100 @@ class RequestHandler:
         self.optimiser = scheduler.FlexEventOptimiser()
 
 
+    # Builders are stateless, so a single instance of each is shared across requests
+    _FLEX_BUILDER = scheduler.FlexibleEventBuilder()
+    _FIXED_BUILDER = scheduler.FixedEventBuilder()
+
+    # Event constructors keyed on is_flexible, so the JSON is dispatched with a single lookup
+    _EVENT_CONSTRUCTORS = {
+        True: lambda j, google_id: RequestHandler._FLEX_BUILDER.create_flexible_event(
+            j.get('earliest_start'), j.get('latest_end'), j.get('duration_minutes'), j.get('summary'), google_id),
+        False: lambda j, google_id: RequestHandler._FIXED_BUILDER.create_fixed_event(
+            j.get('start_time'), j.get('end_time'), j.get('summary')),
+    }
+
     @staticmethod
-    def _create_event_from_json(event_json: dict) -> scheduler.Event:
-        #Create event object from json
-        if event_json['is_flexible']:
-            eb = scheduler.FlexibleEventBuilder()
-            new_event = eb.create_flexible_event(event_json['earliest_start'],
-                                                 event_json['latest_end'],
-                                                 event_json['duration_minutes'],
-                                                 event_json['summary'])
+    def _create_event_from_json(event_json: dict, google_id: str = None) -> scheduler.Event:
+        #Create event object from json. When editing, google_id is the event being replaced, so its old slot is free
+        return RequestHandler._EVENT_CONSTRUCTORS[bool(event_json.get('is_flexible'))](event_json, google_id)
 
-        else:
-            fixed_eb = scheduler.FixedEventBuilder()
-            new_event = fixed_eb.create_fixed_event(event_json['start_time'],
-                                                    event_json['end_time'],
-                                                    event_json['summary'])
-        return new_event
+
+    def _day_to_optimise(self, dt: datetime) -> Optional[datetime]:
+        """
+        Checks whether the day containing dt has anything for the optimiser to move
+        :param dt: Datetime on the day that was changed
+        :return: dt if the day has a flexible event and at least one other event to clash with, None otherwise
+        """
+        total, flexible = self.db.count_events_in_date_range(self.dtc.get_cur_midnight(dt), self.dtc.get_next_midnight(dt))
+        if flexible == 0 or total < 2:
+            return None
+        return dt
 
 
     def optimise_events(self, dt):
         # Optimise flexible events for the day
         processed_events = self.optimiser.run_ILP_optimiser(dt)
-        for e in processed_events:
-            if scheduler.Database().event_status(e) == scheduler.EventStatus.MODIFIED:
-                self.em.edit_event(e)
+        self.apply_optimised_events(processed_events)
 
 
-    def get_events(self, in_range: bool = False, from_date: str = "", to_date: str = "") -> list:
+    def apply_optimised_events(self, processed_events: list) -> None:
+        # Push any events the optimiser moved to the db and Google calendar (in batches)
+        statuses = self.db.event_statuses(processed_events)
+        modified = [e for e in processed_events if statuses[e.google_id] is scheduler.EventStatus.MODIFIED]
+        self.em.edit_events(modified)
+
+
+    def get_events(self, in_range: bool = False, from_date: Union[datetime, str] = "", to_date: Union[datetime, str] = "") -> list:
         events = None
+        #sync db with Google calendar
+        self.em.sync_gc_to_db()
+
         if in_range:
-            from_dt = self.dtc.convert_str_to_dt(from_date)
-            to_dt = self.dtc.convert_str_to_dt(to_date)
-            #sync db with Google calendar
-            self.em.sync_gc_to_db(in_range=True, start_dt=from_dt, end_dt=to_dt)
+            #The API passes parsed datetimes, dd-mm-YYYY strings are still accepted from other callers
+            from_dt = from_date if isinstance(from_date, datetime) else self.dtc.convert_str_to_dt(from_date)
+            to_dt = to_date if isinstance(to_date, datetime) else self.dtc.convert_str_to_dt(to_date)
             # Fetch events from db in date range
-            events = scheduler.Database().get_events_in_date_range(from_dt, to_dt)
+            events = self.db.get_events_in_date_range(from_dt, to_dt, as_json=True)
 
         else:
-            self.em.sync_gc_to_db()
             # Fetch all upcoming events from db
-            events = scheduler.Database().get_upcoming_events()
+            events = self.db.get_upcoming_events(as_json=True)
 
-        return [e.to_json() for e in events]
+        #Rows come back from the db already in to_json form
+        return events
 
 
-    def add_event(self, event_json: dict) -> None:
+    def add_event(self, event_json: dict) -> Optional[datetime]:
         #Create event object from json
         new_event = self._create_event_from_json(event_json)
 
         #Submit event
         self.em.submit_event(new_event)
 
-        #optimise events for the day
-        self.optimise_events(new_event.start_dt)
+        #Return the day that now needs optimising (the caller schedules the optimisation)
+        return self._day_to_optimise(new_event.start_dt)
 
 
-    def edit_event(self, google_id: str, updated_event_json: dict) -> None:
+    def edit_event(self, google_id: str, updated_event_json: dict) -> Optional[datetime]:
 
         #Fetch existing event from db
         existing_event = self.db.get_event_by_google_id(google_id)
 
-        #update existing event using json data
-        #if event was flexible and now isn't, or vice versa, delete and re-add
+        #update existing event using json data (the event's own stored row is not a clash for its new slot)
+        updated_event = self._create_event_from_json(updated_event_json, google_id)
 
-        if existing_event.is_flexible != updated_event_json['is_flexible']:
-            print('deleting and adding')
-            self.em.delete_event(existing_event)
-            self.add_event(updated_event_json)
+        #if event was flexible and now isn't, or vice versa, convert it in place
+        if existing_event.is_flexible != updated_event.is_flexible:
+            logger.debug("Converting event %s between fixed and flexible", google_id)
+            self.em.convert_event(existing_event, updated_event)
 
         else:
-            print('updating')
-            updated_event = self._create_event_from_json(updated_event_json)
+            logger.debug("Updating event %s", google_id)
             updated_event.google_id = google_id
             self.em.edit_event(updated_event, update_valid_window=True)
 
-            #optimise events for the day
-            self.optimise_events(updated_event.start_dt)
-
+        #Return the day that now needs optimising (the caller schedules the optimisation)
+        return self._day_to_optimise(updated_event.start_dt)
 
 
     def del_event(self, google_id: str) -> None:
@@ -95,6 +117,65 @@ class RequestHandler:
         self.em.delete_event(existing_event)
 
 
+# Each worker process keeps one optimiser, so the previous solution for a day can warm start the next solve
+_worker_optimiser = scheduler.FlexEventOptimiser()
+
+
+def solve_day(dt_iso: str) -> list:
+    """
+    Runs the ILP optimiser for a day without applying the results. Kept at module level so it can be
+    pickled and sent to a worker process
+    :param dt_iso: ISO format datetime on the day to optimise
+    :return: List of the day's events with their optimised start/end times
+    """
+    return _worker_optimiser.run_ILP_optimiser(datetime.fromisoformat(dt_iso))
+
+
+class OptimisationDebouncer:
+    """
+    Coalesces optimisation requests for the same day, so a burst of adds/edits triggers a single ILP run
+    """
+    def __init__(self, optimise, delay: float = 0.5):
+        # optimise is a coroutine function taking the datetime of the day to optimise
+        self.optimise = optimise
+        self.delay = delay
+        # Days with a request waiting out the debounce window or being optimised, days being optimised, and days
+        # that were requested again while being optimised
+        self._pending = set()
+        self._running = set()
+        self._rerun = set()
+
+    async def request(self, dt: datetime) -> None:
+        """
+        Runs the optimiser for the day of dt once the debounce window has passed. Requests for a day that is already
+        waiting are dropped, as the pending run will pick up their changes. A request that arrives while the day is
+        being optimised may not be seen by that run, so the day is optimised again once the run finishes
+        :param dt: Datetime on the day to optimise
+        :return: None
+        """
+        day = dt.date()
+        if day in self._pending:
+            if day in self._running:
+                self._rerun.add(day)
+            return
+
+        self._pending.add(day)
+        try:
+            while True:
+                await asyncio.sleep(self.delay)
+                self._running.add(day)
+                self._rerun.discard(day)
+                try:
+                    await self.optimise(dt)
+                finally:
+                    self._running.discard(day)
+                if day not in self._rerun:
+                    break
+        finally:
+            self._pending.discard(day)
+            self._rerun.discard(day)
+
+
 def main():
     print(RequestHandler().get_events(in_range=True, from_date='27-10-2025', to_date='30-10-2025'))
 
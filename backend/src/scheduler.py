@@ -1,32 +1,61 @@
 from datetime import datetime, date, time, timedelta
+import logging
 import os.path
 import zoneinfo
 from tzlocal import get_localzone_name
 import sqlite3
 import sys
-from typing import Tuple, List
-from abc import ABC
+import threading
+from bisect import bisect_left
+from typing import Tuple, List, Optional, Union
 from enum import Enum
+from functools import lru_cache
 import pulp
 
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+logger = logging.getLogger(__name__)
+
 # If modifying these scopes, delete the file token.json.
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
 WORKING_DIR = os.path.dirname(__file__)
 
 
+@lru_cache(maxsize=4096)
+def _parse_iso(dt_str: str) -> datetime:
+    """
+    Parses an ISO 8601 string, caching results since the same timestamps recur across syncs (datetimes are immutable)
+    :param dt_str: ISO 8601 representation of the datetime
+    :return: Parsed datetime
+    """
+    return datetime.fromisoformat(dt_str)
+
+
+@lru_cache(maxsize=None)
+def _zone(tz_name: str) -> zoneinfo.ZoneInfo:
+    """
+    Returns the ZoneInfo for a timezone name, looked up once per name for the life of the process
+    :param tz_name: IANA timezone name, e.g. Europe/London
+    :return: ZoneInfo for the timezone
+    """
+    return zoneinfo.ZoneInfo(tz_name)
+
+
 class Singleton(type):
     _instances = {}
 
     def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
-        return cls._instances[cls]
+        #Fast path is a single dict lookup once the instance exists
+        instance = cls._instances.get(cls)
+        if instance is None:
+            instance = cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
+        return instance
 
     @classmethod
     def clear_instances(cls):
@@ -58,10 +87,14 @@ class OrderBy(Enum):
     END = "valid_end_dt, valid_start_dt"
 
 
-class Event(ABC):
+class Event:
     """
     Class that holds information about a calendar event
     """
+    #Events are created once per db row, slots avoid a per-instance __dict__
+    __slots__ = ("start_dt", "end_dt", "is_flexible", "summary", "valid_start_dt", "valid_end_dt", "google_id",
+                 "_duration_min")
+
     def __init__(self, summary: str,
                  start_dt: datetime,
                  end_dt: datetime,
@@ -73,23 +106,37 @@ class Event(ABC):
         self.valid_start_dt: datetime = start_dt
         self.valid_end_dt: datetime = end_dt
         self.google_id: str = google_id
+        #Duration is cached. Events are only moved after creation through reschedule, which keeps the duration, so
+        #start_dt and end_dt must not be reassigned separately
+        self._duration_min: int = int((end_dt - start_dt).total_seconds() // 60)
+
+    def reschedule(self, start_dt: datetime) -> None:
+        """
+        Moves the event to a new start time, keeping its duration
+        :param start_dt: New start datetime
+        :return: None
+        """
+        self.start_dt = start_dt
+        self.end_dt = start_dt + timedelta(minutes=self._duration_min)
 
     @property
     def duration(self) -> int:
-        return int((self.end_dt - self.start_dt).total_seconds() // 60)
+        return self._duration_min
+
+    # Keys of the dict returned by to_json, in order. Shared with the db's to_json style row builder
+    JSON_KEYS = ("summary", "date", "start_time", "end_time", "earliest_start", "latest_end", "duration_minutes",
+                 "is_flexible", "google_id")
 
     def to_json(self) -> dict:
-        return {
-            "summary": self.summary,
-            "date": self.start_dt.date().isoformat(),
-            "start_time": self.start_dt.time().isoformat(timespec='minutes'),
-            "end_time": self.end_dt.time().isoformat(timespec='minutes'),
-            "earliest_start": self.valid_start_dt.time().isoformat(timespec='minutes'),
-            "latest_end": self.valid_end_dt.time().isoformat(timespec='minutes'),
-            "duration_minutes": self.duration,
-            "is_flexible": self.is_flexible,
-            "google_id": self.google_id
-        }
+        return dict(zip(Event.JSON_KEYS, (self.summary,
+                                          self.start_dt.date().isoformat(),
+                                          self.start_dt.time().isoformat(timespec='minutes'),
+                                          self.end_dt.time().isoformat(timespec='minutes'),
+                                          self.valid_start_dt.time().isoformat(timespec='minutes'),
+                                          self.valid_end_dt.time().isoformat(timespec='minutes'),
+                                          self.duration,
+                                          self.is_flexible,
+                                          self.google_id)))
 
     def get_start_end_dt(self) -> Tuple[datetime, datetime]:
         """
@@ -104,14 +151,14 @@ class FixedEvent(Event):
     Fixed events can only exist at a fixed time, and will not be rearranged if a conflicting event is added
     E.g. a fixed event at 6-7pm will also have a valid window of 6-7pm. The event cannot be moved from this time
     """
+    __slots__ = ()
+
     def __init__(self, summary: str,
                  start_dt: datetime,
                  end_dt: datetime,
                  google_id: str = None):
+        # Event already sets is_flexible to False and the valid window to the event's own start and end
         super().__init__(summary, start_dt, end_dt, google_id)
-        self.is_flexible: bool = False
-        self.valid_start_dt: datetime = start_dt
-        self.valid_end_dt: datetime = end_dt
 
     def __str__(self):
         return f"Fixed Event {self.summary} ({self.start_dt} to {self.end_dt})"
@@ -130,6 +177,8 @@ class FlexibleEvent(Event):
     E.g. An event with a duration of 30 mins and a valid window of 6-7pm can exist at any time between 6-7pm but will
          always be 30 mins long
     """
+    __slots__ = ()
+
     def __init__(self, summary: str,
                  start_dt: datetime,
                  end_dt: datetime,
@@ -161,7 +210,7 @@ class FlexibleEvent(Event):
         return self.valid_start_dt, self.valid_end_dt
 
 
-class EventBuilder(ABC):
+class EventBuilder:
     """
     Builder class for events
     """
@@ -180,8 +229,9 @@ class EventBuilder(ABC):
         day = dtc.convert_str_to_date(date_str)
         start_time = dtc.convert_str_to_time(start_time_str)
         end_time = dtc.convert_str_to_time(end_time_str)
-        start_dt = datetime.combine(day, start_time, tzinfo=zoneinfo.ZoneInfo(Timezone().timezone))
-        end_dt = datetime.combine(day, end_time, tzinfo=zoneinfo.ZoneInfo(Timezone().timezone))
+        tzinfo = Timezone().zone_info
+        start_dt = datetime.combine(day, start_time, tzinfo=tzinfo)
+        end_dt = datetime.combine(day, end_time, tzinfo=tzinfo)
 
         if end_dt <= start_dt:
             raise ValueError("Start time must be before end time")
@@ -208,8 +258,8 @@ class FixedEventBuilder(EventBuilder):
 
         #Generate datetime representation of start and end dates
         try:
-            start_dt = datetime.fromisoformat(start_time_str)
-            end_dt = datetime.fromisoformat(end_time_str)
+            start_dt = _parse_iso(start_time_str)
+            end_dt = _parse_iso(end_time_str)
             #start_dt, end_dt = self._generate_dts(date_str, start_time_str, end_time_str)
         except ValueError as e:
             print(e)
@@ -241,7 +291,8 @@ class FlexibleEventBuilder(EventBuilder):
     Builder class for flexible events
     """
 
-    def create_flexible_event(self, valid_start_time_str: str, valid_end_time_str: str, duration: int, summary: str) -> FlexibleEvent:
+    def create_flexible_event(self, valid_start_time_str: str, valid_end_time_str: str, duration: int, summary: str,
+                              google_id: str = None) -> FlexibleEvent:
         """
         Creates a flexible event from the input parameters
         :param date_str: String representation of the event date
@@ -249,6 +300,7 @@ class FlexibleEventBuilder(EventBuilder):
         :param valid_end_time_str: String representation of the end of the valid time range
         :param duration: Duration of the flexible event
         :param summary: Event summary
+        :param google_id: Google ID of the event being replaced when editing, its stored row is not treated as a clash
         :return: FlexibleEvent object containing event information provided in input args
         """
 
@@ -257,16 +309,17 @@ class FlexibleEventBuilder(EventBuilder):
 
         #Generate valid timerange datetimes from the valid start and end dates/times
         try:
-            valid_start_dt = datetime.fromisoformat(valid_start_time_str)
-            valid_end_dt = datetime.fromisoformat(valid_end_time_str)
+            valid_start_dt = _parse_iso(valid_start_time_str)
+            valid_end_dt = _parse_iso(valid_end_time_str)
             #valid_start_dt, valid_end_dt = self._generate_dts(date_str, valid_start_time_str, valid_end_time_str)
         except ValueError as e:
             print(e)
             sys.exit(1)
 
 
-        # Fetch list of all events in the valid window in chronological order
-        clashes = Database().get_events_in_date_range(valid_start_dt, valid_end_dt, EventType.ALL)
+        # Fetch the (start, end) timestamps of all events in the valid window in chronological order
+        clashes = Database().get_event_intervals_in_range(valid_start_dt, valid_end_dt, as_timestamps=True,
+                                                          exclude_google_id=google_id)
 
         try:
             slot_finder = FlexSlotFinder(valid_start_dt, valid_end_dt, duration)
@@ -274,7 +327,7 @@ class FlexibleEventBuilder(EventBuilder):
             print(e)
             sys.exit(1)
 
-        start_dt, end_dt = slot_finder.find_valid_slot(clashes)
+        start_dt, end_dt = slot_finder.find_valid_slot_in_timestamps(clashes)
 
         if not slot_finder.no_clashes:
             print("No valid time slot can be found for this event.")
@@ -303,20 +356,51 @@ class FlexSlotFinder:
         self.end_dt = None
 
     def find_valid_slot(self, events: List[Event]) -> Tuple[datetime, datetime]:
+        """
+        Finds the first gap in the valid range that fits the event, in a single pass over the events
+        :param events: Events that could clash with the flexible event
+        :return: Start and end datetimes of the slot (the start of the valid range if there is no free slot)
+        """
+        return self.find_valid_slot_in_intervals([event.get_start_end_dt() for event in events])
 
-        # Iterate through events
-        # If the interval between the end time of one event and the start of the next is larger than the duration, put the start/end times in this space
-        for i in range(0, len(events) + 1):
-            prev_event_end = self.valid_start_dt if i == 0 else events[i - 1].end_dt
-            next_event_start = self.valid_end_dt if i == len(events) else events[i].start_dt
-            candidate_start_dt = prev_event_end
-            candidate_end_dt = prev_event_end + timedelta(minutes=self.duration)
-            if candidate_end_dt <= next_event_start and candidate_end_dt <= self.valid_end_dt:
-                self.no_clashes = True
-                self.start_dt = candidate_start_dt
-                self.end_dt = candidate_end_dt
+    def find_valid_slot_in_intervals(self, intervals: List[Tuple[datetime, datetime]]) -> Tuple[datetime, datetime]:
+        """
+        Finds the first gap in the valid range that fits the event, in a single pass over the busy intervals
+        :param intervals: (start, end) datetimes of the events that could clash with the flexible event
+        :return: Start and end datetimes of the slot (the start of the valid range if there is no free slot)
+        """
+        return self.find_valid_slot_in_timestamps([(int(start_dt.timestamp()), int(end_dt.timestamp()))
+                                                   for start_dt, end_dt in intervals])
 
-                return self.start_dt, self.end_dt
+    def find_valid_slot_in_timestamps(self, intervals: List[Tuple[int, int]]) -> Tuple[datetime, datetime]:
+        """
+        Finds the first gap in the valid range that fits the event, in a single pass over the busy intervals
+        :param intervals: (start, end) Unix timestamps of the events that could clash with the flexible event
+        :return: Start and end datetimes of the slot (the start of the valid range if there is no free slot)
+        """
+        duration = self.duration * 60
+        valid_end = int(self.valid_end_dt.timestamp())
+
+        # Walk the intervals in start order, tracking the latest end time seen so far (the end of the merged busy
+        # interval), so events that overlap or sit inside another event don't open up false gaps. The walk is done on
+        # integer timestamps, so no datetime arithmetic happens per interval.
+        # Timsort is linear on the already sorted lists returned by the DB
+        busy_until = int(self.valid_start_dt.timestamp())
+        for start, end in sorted(intervals):
+            # The gap before this event fits the flexible event
+            if start - busy_until >= duration:
+                break
+            if end > busy_until:
+                busy_until = end
+            if busy_until >= valid_end:
+                break
+
+        if busy_until + duration <= valid_end:
+            self.no_clashes = True
+            self.start_dt = datetime.fromtimestamp(busy_until, self.valid_start_dt.tzinfo)
+            self.end_dt = self.start_dt + timedelta(minutes=self.duration)
+
+            return self.start_dt, self.end_dt
 
         return self.valid_start_dt, self.valid_start_dt + timedelta(minutes=self.duration)
 
@@ -327,6 +411,7 @@ class Timezone(metaclass=Singleton):
     """
     def __init__(self):
         self.timezone = self.local_tz()
+        self.zone_info = _zone(self.timezone)
 
     @staticmethod
     def local_tz() -> str:
@@ -342,12 +427,309 @@ class Timezone(metaclass=Singleton):
             sys.exit(1)
 
 
+# SQL used by Database. Statements are kept as constants so every call sends identical text, which hits the
+# connection's prepared statement cache instead of being re-parsed and re-planned
+
+# Columns needed to build Event objects
+_SQL_EVENT_COLUMNS = "summary, is_flexible, event_start_dt, event_end_dt, valid_start_dt, valid_end_dt, google_id, timezone"
+
+# Columns needed for Event.to_json style dicts, so read-only queries don't need to build Event objects. Times are
+# formatted in Python in each event's stored timezone, as SQLite's 'localtime' would use the server's zone instead
+_SQL_JSON_COLUMNS = "summary, event_start_dt, event_end_dt, valid_start_dt, valid_end_dt, duration, is_flexible, google_id, timezone"
+
+# Event times are stored as INTEGER unix epoch seconds, which are compared and indexed more cheaply than ISO strings
+_SQL_CREATE_EVENTS = '''
+                     CREATE TABLE IF NOT EXISTS events
+                     (
+                         id             INTEGER PRIMARY KEY AUTOINCREMENT,
+                         summary        TEXT     NOT NULL,
+                         is_flexible    INTEGER  NOT NULL,
+                         event_start_dt INTEGER  NOT NULL,
+                         event_end_dt   INTEGER  NOT NULL,
+                         duration       INTEGER  NOT NULL,
+                         valid_start_dt INTEGER,
+                         valid_end_dt   INTEGER,
+                         timezone       TEXT     NOT NULL,
+                         google_id      TEXT,
+                         last_updated   DATETIME NOT NULL
+                     )
+                     '''
+
+# Copies rows from the old ISO string schema. Strings with a UTC offset are converted directly, naive strings were
+# written in local time
+_ISO_TO_EPOCH = ("CAST(CASE WHEN substr({column}, -6, 1) IN ('+', '-') THEN strftime('%s', {column}) "
+                 "ELSE strftime('%s', {column}, 'utc') END AS INTEGER)")
+_SQL_MIGRATE_ISO_TO_EPOCH = f'''
+                            INSERT INTO events (id, summary, is_flexible, event_start_dt, event_end_dt, duration,
+                                                valid_start_dt, valid_end_dt, timezone, google_id, last_updated)
+                            SELECT id, summary, is_flexible,
+                                   {_ISO_TO_EPOCH.format(column="event_start_dt")},
+                                   {_ISO_TO_EPOCH.format(column="event_end_dt")},
+                                   duration,
+                                   {_ISO_TO_EPOCH.format(column="valid_start_dt")},
+                                   {_ISO_TO_EPOCH.format(column="valid_end_dt")},
+                                   timezone, google_id, last_updated
+                            FROM events_iso
+                            '''
+
+# Index lookups by google_id, and the end/start ranges used by the date range and upcoming event queries.
+# google_id is unique so inserts can skip duplicates with ON CONFLICT (NULLs, for events not yet in the calendar,
+# don't conflict). It replaces the earlier non-unique google_id index
+_SQL_CREATE_INDEXES = (
+    "DROP INDEX IF EXISTS idx_events_google_id",
+    "DROP INDEX IF EXISTS idx_events_end_start",
+    # Replaced by idx_events_cover_v2, which adds duration
+    "DROP INDEX IF EXISTS idx_events_cover",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_events_google_id_unique ON events(google_id)",
+    "CREATE INDEX IF NOT EXISTS idx_events_flex_end_start ON events(is_flexible, event_end_dt, event_start_dt)",
+    # Covers every column the list queries return, so they are answered from the index without touching the table
+    "CREATE INDEX IF NOT EXISTS idx_events_cover_v2 ON events(event_end_dt, event_start_dt, is_flexible, summary, "
+    "duration, valid_start_dt, valid_end_dt, google_id, timezone)",
+    # No index on the OrderBy columns (valid_start_dt/valid_end_dt): the planner would walk it to skip the sort, but
+    # that scans every past event to reach the requested window. Sorting the few rows found via idx_events_cover_v2 is
+    # far cheaper
+)
+
+_SQL_CREATE_SYNC_STATE = '''
+                         CREATE TABLE IF NOT EXISTS sync_state
+                         (
+                             calendar_id TEXT PRIMARY KEY,
+                             sync_token  TEXT NOT NULL
+                         )
+                         '''
+
+# Single row counter that triggers bump whenever an event is added, deleted or has its data changed, so every process
+# using the database can tell when reads it has cached are stale. Only touching last_updated (as status checks do)
+# is not a change
+_SQL_CREATE_DATA_VERSION = (
+    "CREATE TABLE IF NOT EXISTS data_version (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO data_version (id, version) VALUES (0, 0)",
+    "CREATE TRIGGER IF NOT EXISTS trg_events_insert_version AFTER INSERT ON events "
+    "BEGIN UPDATE data_version SET version = version + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS trg_events_update_version AFTER UPDATE OF summary, is_flexible, event_start_dt, "
+    "event_end_dt, duration, valid_start_dt, valid_end_dt, timezone, google_id ON events "
+    "BEGIN UPDATE data_version SET version = version + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS trg_events_delete_version AFTER DELETE ON events "
+    "BEGIN UPDATE data_version SET version = version + 1; END",
+)
+
+_SQL_GET_DATA_VERSION = "SELECT version FROM data_version WHERE id = 0"
+
+# Status checks touch the event's last updated timestamp and return its stored metadata in the same statement,
+# rather than a SELECT followed by an UPDATE
+_SQL_EVENT_STATUS = '''
+                    UPDATE events
+                    SET last_updated = ?
+                    WHERE google_id = ?
+                    RETURNING summary, event_start_dt, event_end_dt
+                    '''
+
+# Statuses of many events at once, {placeholders} is filled with one ? per google_id
+_SQL_EVENT_STATUSES = '''
+                      UPDATE events
+                      SET last_updated = ?
+                      WHERE google_id IN ({placeholders})
+                      RETURNING google_id, summary, event_start_dt, event_end_dt
+                      '''
+
+_SQL_EVENT_EXISTS = '''
+                    SELECT 1
+                    FROM events
+                    WHERE google_id = ?
+                    LIMIT 1
+                    '''
+
+_SQL_INSERT_EVENT = '''
+                    INSERT INTO events (summary, is_flexible, event_start_dt, event_end_dt, duration, valid_start_dt,
+                                        valid_end_dt, timezone, google_id, last_updated)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(google_id) DO NOTHING
+                    RETURNING id
+                    '''
+
+# _SQL_INSERT_EVENT without RETURNING, for executemany (which discards returned rows)
+_SQL_INSERT_EVENTS = '''
+                     INSERT INTO events (summary, is_flexible, event_start_dt, event_end_dt, duration, valid_start_dt,
+                                         valid_end_dt, timezone, google_id, last_updated)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                     ON CONFLICT(google_id) DO NOTHING
+                     '''
+
+_SQL_DELETE_EVENT = '''
+                    DELETE FROM events
+                    WHERE google_id = ?
+                    RETURNING id
+                    '''
+
+# Deletes many events at once, {placeholders} is filled with one ? per google_id
+_SQL_DELETE_EVENTS = '''
+                     DELETE FROM events
+                     WHERE google_id IN ({placeholders})
+                     RETURNING google_id
+                     '''
+
+# A full sync returns every event in the calendar, so the google_ids it returned are held in a temporary table and
+# every synced row (one with a google_id) that is not in it is deleted
+_SQL_CREATE_SYNCED_IDS = "CREATE TEMP TABLE IF NOT EXISTS synced_google_ids (google_id TEXT PRIMARY KEY)"
+_SQL_CLEAR_SYNCED_IDS = "DELETE FROM synced_google_ids"
+_SQL_INSERT_SYNCED_ID = "INSERT OR IGNORE INTO synced_google_ids (google_id) VALUES (?)"
+_SQL_DELETE_UNSYNCED_EVENTS = '''
+                              DELETE FROM events
+                              WHERE google_id IS NOT NULL
+                                AND google_id NOT IN (SELECT google_id FROM synced_google_ids)
+                              RETURNING google_id
+                              '''
+
+# Queries with a {columns} list and {order_by} column are formatted per call; the formatted text is the same
+# for the same arguments, so they still hit the statement cache
+_SQL_UPCOMING_ALL = """
+                    SELECT {columns}
+                    FROM events
+                    WHERE event_end_dt >= ?
+                    ORDER BY {order_by}
+                    LIMIT ?"""
+
+_SQL_UPCOMING_TYPED = """
+                      SELECT {columns}
+                      FROM events
+                      WHERE (is_flexible = ?)
+                       AND (event_end_dt >= ?)
+                      ORDER BY {order_by}
+                      LIMIT ?"""
+
+# Events overlap the range if they start before it ends and end after it starts
+_SQL_RANGE_ALL = """
+                 SELECT {columns}
+                 FROM events
+                 WHERE event_start_dt < ? AND event_end_dt > ?
+                 ORDER BY {order_by}"""
+
+_SQL_RANGE_TYPED = """
+                   SELECT {columns}
+                   FROM events
+                   WHERE (is_flexible = ?)
+                    AND event_start_dt < ? AND event_end_dt > ?
+                   ORDER BY {order_by}"""
+
+_SQL_RANGE_INTERVALS = """
+                       SELECT event_start_dt, event_end_dt, timezone
+                       FROM events
+                       WHERE event_start_dt < ? AND event_end_dt > ?
+                       ORDER BY event_start_dt"""
+
+# As _SQL_RANGE_INTERVALS, leaving out one event (an event being edited must not clash with its own stored row)
+_SQL_RANGE_INTERVALS_EXCLUDING = """
+                                 SELECT event_start_dt, event_end_dt, timezone
+                                 FROM events
+                                 WHERE event_start_dt < ? AND event_end_dt > ? AND google_id != ?
+                                 ORDER BY event_start_dt"""
+
+_SQL_RANGE_COUNT = """
+                   SELECT COUNT(*), COALESCE(SUM(is_flexible), 0)
+                   FROM events
+                   WHERE event_start_dt < ? AND event_end_dt > ?"""
+
+_SQL_EVENT_BY_GOOGLE_ID = f'''
+                          SELECT {_SQL_EVENT_COLUMNS}
+                          FROM events
+                          WHERE google_id = ?
+                          LIMIT 1
+                          '''
+
+_SQL_EDIT_EVENT = '''
+                  UPDATE events
+                  SET summary = ?,
+                      event_start_dt = ?,
+                      event_end_dt   = ?,
+                      duration = ?,
+                      timezone = ?,
+                      last_updated = ?
+                  WHERE google_id = ?
+                    AND (summary <> ? OR event_start_dt <> ? OR event_end_dt <> ?)
+                  RETURNING id
+                  '''
+
+_SQL_EDIT_VALID_WINDOW = '''
+                         UPDATE events
+                         SET valid_start_dt = ?,
+                             valid_end_dt = ?
+                         WHERE google_id = ?
+                         '''
+
+_SQL_CONVERT_EVENT = '''
+                     UPDATE events
+                     SET summary = ?,
+                         is_flexible = ?,
+                         event_start_dt = ?,
+                         event_end_dt = ?,
+                         duration = ?,
+                         valid_start_dt = ?,
+                         valid_end_dt = ?,
+                         timezone = ?,
+                         last_updated = ?
+                     WHERE google_id = ?
+                     '''
+
+_SQL_UPDATE_GOOGLE_ID = '''
+                        UPDATE events
+                        SET google_id = ?
+                        WHERE id = ?
+                        '''
+
+_SQL_GET_SYNC_TOKEN = '''
+                      SELECT sync_token
+                      FROM sync_state
+                      WHERE calendar_id = ?
+                      '''
+
+_SQL_SET_SYNC_TOKEN = '''
+                      INSERT INTO sync_state (calendar_id, sync_token)
+                      VALUES (?, ?)
+                      ON CONFLICT(calendar_id) DO UPDATE SET sync_token = excluded.sync_token
+                      '''
+
+
 class Database(metaclass=Singleton):
 
     def __init__(self, db_name=os.path.join(WORKING_DIR, "events.db")) -> None:
         self.db_name = db_name
+        # Connections are opened once per thread and reused, rather than opened and closed for every query
+        self.__local = threading.local()
+        self.__connections = []
         self.__create_table()
 
+    def __connection(self) -> sqlite3.Connection:
+        """
+        Returns the calling thread's connection to the database, opening it on first use
+        :return: SQLite connection
+        """
+        conn = getattr(self.__local, "conn", None)
+        if conn is None:
+            # "file:" names are opened as URIs, e.g. a shared in-memory database
+            conn = sqlite3.connect(self.db_name, check_same_thread=False, uri=self.db_name.startswith("file:"))
+            # WAL lets readers run concurrently with a writer, and with WAL synchronous=NORMAL only syncs at
+            # checkpoints while staying corruption safe. Each connection gets a 64MB page cache, temp tables/indices
+            # are kept in memory and the file is mmapped
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA cache_size=-65536")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA mmap_size=268435456")
+            self.__local.conn = conn
+            self.__connections.append(conn)
+
+        return conn
+
+    def close(self) -> None:
+        """
+        Closes all open connections to the database
+        :return: None
+        """
+        for conn in self.__connections:
+            conn.close()
+        self.__connections = []
+        self.__local = threading.local()
+
     def __create_table(self) -> None:
         """
         Creates empty SQLite table for events to be stored in
@@ -355,47 +737,45 @@ class Database(metaclass=Singleton):
         """
 
         # Create new database called 'events.db' and connect
-        conn = sqlite3.connect(self.db_name)
+        conn = self.__connection()
         print("Opened database successfully")
 
-        # Create a new table called events, containing columns required for events to be stored
-        conn.execute('''
-                     CREATE TABLE IF NOT EXISTS events
-                     (
-                         id             INTEGER PRIMARY KEY AUTOINCREMENT,
-                         summary        TEXT     NOT NULL,
-                         is_flexible    INTEGER  NOT NULL,
-                         event_start_dt TEXT     NOT NULL,
-                         event_end_dt   TEXT     NOT NULL,
-                         duration       INTEGER  NOT NULL,
-                         valid_start_dt TEXT,
-                         valid_end_dt   TEXT,
-                         timezone       TEXT     NOT NULL,
-                         google_id      TEXT,
-                         last_updated   DATETIME NOT NULL
-                     )
-                     ''')
+        # Writes run in the connection's context manager, which commits on success and rolls back on error
+        with conn:
+            # DDL doesn't open a transaction implicitly, so one is started here to make any migration atomic
+            conn.execute("BEGIN")
+
+            # Databases created before event times were stored as epoch seconds are migrated to the new schema
+            column_types = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(events)")}
+            migrate = column_types.get("event_start_dt") == "TEXT"
+            if migrate:
+                print("Migrating events table to epoch timestamps")
+                conn.execute("ALTER TABLE events RENAME TO events_iso")
+
+            # Create a new table called events, containing columns required for events to be stored
+            conn.execute(_SQL_CREATE_EVENTS)
+
+            if migrate:
+                conn.execute(_SQL_MIGRATE_ISO_TO_EPOCH)
+                conn.execute("DROP TABLE events_iso")
+
+            for sql in _SQL_CREATE_INDEXES:
+                conn.execute(sql)
+
+            # Create a table to store the Google Calendar sync token for each calendar
+            conn.execute(_SQL_CREATE_SYNC_STATE)
 
-        # Close connection
-        conn.commit()
-        conn.close()
+            for sql in _SQL_CREATE_DATA_VERSION:
+                conn.execute(sql)
 
 
-    def __update_timestamp(self, event: Event) -> None:
+    def _event_exists(self, google_id: str) -> bool:
         """
-        Updates event last modified timestamp in db
-        :param event:
-        :return:
+        Checks whether an event with the given google_id is stored in the db
+        :param google_id: Google Calendar ID of the event
+        :return: True if the event exists, False otherwise
         """
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute('''
-                       UPDATE events
-                       SET last_updated = ?
-                       WHERE google_id = ?
-                       ''', (datetime.now().isoformat(), event.google_id))
-        conn.commit()
-        conn.close()
+        return self.__connection().execute(_SQL_EVENT_EXISTS, (google_id,)).fetchone() is not None
 
     def event_status(self, gc_event: Event) -> EventStatus:
         """
@@ -405,31 +785,64 @@ class Database(metaclass=Singleton):
         """
 
         #Connect to db
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        conn = self.__connection()
+        with conn:
+            cursor = conn.cursor()
 
-        # Check if event with same google_id exists
-        cursor.execute('''
-                       SELECT summary, event_start_dt, event_end_dt
-                       FROM events
-                       WHERE google_id = ?
-                       LIMIT 1
-                       ''', (gc_event.google_id,))
+            # Check if event with same google_id exists, updating its last updated timestamp if so
+            cursor.execute(_SQL_EVENT_STATUS, (datetime.now().isoformat(), gc_event.google_id))
+            db_event = cursor.fetchone()
 
         event_status = EventStatus.NEW
-        db_event = cursor.fetchone()
-        conn.close()
 
         #Check if any metadata for the event has changed
         if db_event:
-            if db_event[0] != gc_event.summary or db_event[1] != gc_event.start_dt.isoformat() or db_event[2] != gc_event.end_dt.isoformat():
+            if db_event[0] != gc_event.summary or db_event[1] != int(gc_event.start_dt.timestamp()) or db_event[2] != int(gc_event.end_dt.timestamp()):
                 event_status = EventStatus.MODIFIED
             else:
                 event_status = EventStatus.UNCHANGED
-            self.__update_timestamp(gc_event)
 
         return event_status
 
+    def event_statuses(self, events: List[Event], now: str = None) -> dict:
+        """
+        Checks whether each of several events has been added or modified (compared to the db), using one query per
+        500 events rather than one per event
+        :param events: Events to check status of
+        :param now: ISO timestamp to set as last updated, the current time if None
+        :return: Dictionary of google_id to EventStatus
+        """
+        conn = self.__connection()
+
+        # Fetch the stored metadata of every event that exists, updating their last modified timestamps together, in
+        # chunks to stay under SQLite's parameter limit
+        google_ids = [event.google_id for event in events]
+        db_events = {}
+        if now is None:
+            now = datetime.now().isoformat()
+        with conn:
+            for chunk_start in range(0, len(google_ids), 500):
+                chunk = google_ids[chunk_start:chunk_start + 500]
+                cursor = conn.execute(_SQL_EVENT_STATUSES.format(placeholders=",".join("?" * len(chunk))),
+                                      [now] + chunk)
+                for google_id, summary, start, end in cursor.fetchall():
+                    db_events[google_id] = (summary, start, end)
+
+        statuses = {}
+        for event in events:
+            db_event = db_events.get(event.google_id)
+            if db_event is None:
+                statuses[event.google_id] = EventStatus.NEW
+                continue
+
+            #Check if any metadata for the event has changed
+            if db_event != (event.summary, int(event.start_dt.timestamp()), int(event.end_dt.timestamp())):
+                statuses[event.google_id] = EventStatus.MODIFIED
+            else:
+                statuses[event.google_id] = EventStatus.UNCHANGED
+
+        return statuses
+
     def add_event(self, event: Event) -> int:
         """
         Adds an event to the database
@@ -437,41 +850,68 @@ class Database(metaclass=Singleton):
         :return: New eventID if successful, -1 otherwise
         """
 
-        # If the event is a duplicate, return False
-        if self.event_status(event) != EventStatus.NEW:
-            raise ValueError(f"Event {event.summary} already exists in the database")
-
         # Connect to the DB
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        conn = self.__connection()
+        with conn:
+            cursor = conn.cursor()
+
+            # Add a new row with event params into the DB, nothing is returned if the google_id already exists
+            cursor.execute(_SQL_INSERT_EVENT, (event.summary,
+                                               int(event.is_flexible),
+                                               int(event.start_dt.timestamp()),
+                                               int(event.end_dt.timestamp()),
+                                               event.duration,
+                                               int(event.valid_start_dt.timestamp()),
+                                               int(event.valid_end_dt.timestamp()),
+                                               Timezone().timezone,
+                                               event.google_id,
+                                               datetime.now().isoformat()))
+
+            row = cursor.fetchone()
+
+        # If the event is a duplicate, raise an error
+        if row is None:
+            raise ValueError(f"Event {event.summary} already exists in the database")
+        new_id = row[0]
 
-        # Add a new row with event params into the DB
-        cursor.execute('''
-                       INSERT INTO events (summary, is_flexible, event_start_dt, event_end_dt, duration, valid_start_dt,
-                                           valid_end_dt, timezone, google_id, last_updated)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                       RETURNING id
-                       ''', (event.summary,
-                             int(event.is_flexible),
-                             event.start_dt.isoformat(),
-                             event.end_dt.isoformat(),
-                             event.duration,
-                             event.valid_start_dt.isoformat(),
-                             event.valid_end_dt.isoformat(),
-                             Timezone().timezone,
-                             event.google_id,
-                             datetime.now().isoformat()))
-
-        new_id = cursor.fetchone()[0]
-        # Close connection to DB
-        conn.commit()
-        conn.close()
-
-        # Print success message and return True
-        print("Event added to database successfully")
+        # Log success and return the new row id
+        logger.debug("Event %s added to database", event.summary)
         return new_id
 
 
+    def add_events(self, events: List[Event], now: str = None) -> int:
+        """
+        Adds several events to the database in a single transaction. Events whose google_id is already in the
+        database are skipped
+        :param events: Events to add to db
+        :param now: ISO timestamp to set as last updated, the current time if None
+        :return: Number of events added
+        """
+
+        conn = self.__connection()
+
+        if now is None:
+            now = datetime.now().isoformat()
+        timezone = Timezone().timezone
+        rows = [(event.summary,
+                 int(event.is_flexible),
+                 int(event.start_dt.timestamp()),
+                 int(event.end_dt.timestamp()),
+                 event.duration,
+                 int(event.valid_start_dt.timestamp()),
+                 int(event.valid_end_dt.timestamp()),
+                 timezone,
+                 event.google_id,
+                 now) for event in events]
+
+        # Duplicates are skipped by ON CONFLICT, so the number added is the cursor's row count (which, unlike the
+        # connection's total changes, leaves out the data version trigger's updates)
+        with conn:
+            added = conn.executemany(_SQL_INSERT_EVENTS, rows).rowcount
+
+        print(f"{added} events added to database successfully")
+        return added
+
     def del_event(self, event: Event) -> None:
         """
         Deletes an event from the database
@@ -479,112 +919,202 @@ class Database(metaclass=Singleton):
         :return: None
         """
 
-        #Check that event exists in the DB
-        if self.event_status(event) == EventStatus.NEW:
+        #Delete event, nothing is returned if it doesn't exist in the DB
+        conn = self.__connection()
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute(_SQL_DELETE_EVENT, (event.google_id,))
+            row = cursor.fetchone()
+
+        if row is None:
             raise ValueError(f"Event {event.summary} does not exist in the database")
+        print(f"Event {event.summary} deleted from database successfully")
 
-        #Delete event
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute('''
-        DELETE FROM events
-            WHERE google_id = ?
-        ''', (event.google_id,))
+    def del_events_by_google_id(self, google_ids: List[str]) -> int:
+        """
+        Deletes several events from the database in a single transaction, using one statement per 500 events rather
+        than one per event
+        :param google_ids: Google IDs of the events to delete
+        :return: Number of events deleted
+        """
+        conn = self.__connection()
 
-        conn.commit()
-        conn.close()
-        print(f"Event {event.summary} deleted from database successfully")
+        deleted = set()
+        with conn:
+            # Chunked to stay under SQLite's parameter limit
+            for chunk_start in range(0, len(google_ids), 500):
+                chunk = google_ids[chunk_start:chunk_start + 500]
+                cursor = conn.execute(_SQL_DELETE_EVENTS.format(placeholders=",".join("?" * len(chunk))), chunk)
+                deleted.update(row[0] for row in cursor.fetchall())
+
+        for google_id in google_ids:
+            if google_id not in deleted:
+                print(f"No event found with google_id {google_id}")
+
+        print(f"{len(deleted)} events deleted from database successfully")
+        return len(deleted)
+
+    def del_events_not_in(self, google_ids: List[str]) -> int:
+        """
+        Deletes every synced event whose google_id is not in google_ids in a single transaction, so the db matches
+        the result of a full sync (events that are not in the calendar yet, with no google_id, are kept)
+        :param google_ids: Google IDs of every event in the calendar
+        :return: Number of events deleted
+        """
+        conn = self.__connection()
+
+        with conn:
+            conn.execute(_SQL_CREATE_SYNCED_IDS)
+            conn.execute(_SQL_CLEAR_SYNCED_IDS)
+            conn.executemany(_SQL_INSERT_SYNCED_ID, ((google_id,) for google_id in google_ids))
+            deleted = len(conn.execute(_SQL_DELETE_UNSYNCED_EVENTS).fetchall())
+            conn.execute(_SQL_CLEAR_SYNCED_IDS)
+
+        print(f"{deleted} events no longer in the calendar deleted from database")
+        return deleted
+
+    @staticmethod
+    def __create_json_from_db_query(db_query: List[tuple]) -> List[dict]:
+        # Same fields (Event.JSON_KEYS) and formatting as Event.to_json, with the stored epoch seconds converted to the
+        # timezone the event was stored in
+        fromts = datetime.fromtimestamp
+        keys = Event.JSON_KEYS
+        events = []
+        for summary, start, end, valid_start, valid_end, duration, is_flexible, google_id, tz_name in db_query:
+            tz = _zone(tz_name)
+            start_dt = fromts(start, tz)
+            end_dt = fromts(end, tz)
+            valid_start_dt = fromts(valid_start, tz)
+            valid_end_dt = fromts(valid_end, tz)
+            events.append(dict(zip(keys, (summary,
+                                          start_dt.date().isoformat(),
+                                          f"{start_dt.hour:02}:{start_dt.minute:02}",
+                                          f"{end_dt.hour:02}:{end_dt.minute:02}",
+                                          f"{valid_start_dt.hour:02}:{valid_start_dt.minute:02}",
+                                          f"{valid_end_dt.hour:02}:{valid_end_dt.minute:02}",
+                                          duration,
+                                          bool(is_flexible),
+                                          google_id))))
+
+        return events
 
     @staticmethod
     def __create_event_from_db_query(db_query:List[tuple]) -> List[Event]:
+        # Times are stored as epoch seconds, and converted back to the timezone the event was stored in
+        fromts = datetime.fromtimestamp
         events = []
-        for event in db_query:
-            if event[1] == 0:
-                events.append(
-                    FixedEvent(event[0], datetime.fromisoformat(event[2]), datetime.fromisoformat(event[3]), event[6]))
+        for summary, is_flexible, start, end, valid_start, valid_end, google_id, tz_name in db_query:
+            tz = _zone(tz_name)
+
+            if is_flexible:
+                events.append(FlexibleEvent(summary, fromts(start, tz), fromts(end, tz),
+                                            fromts(valid_start, tz), fromts(valid_end, tz), google_id))
             else:
-                events.append(
-                    FlexibleEvent(event[0], datetime.fromisoformat(event[2]), datetime.fromisoformat(event[3]),
-                                  datetime.fromisoformat(event[4]), datetime.fromisoformat(event[5]), event[6]))
+                events.append(FixedEvent(summary, fromts(start, tz), fromts(end, tz), google_id))
 
         return events
 
-    def get_upcoming_events(self, num_events: int = 50, event_type: EventType = EventType.ALL, order_by: OrderBy = OrderBy.START) -> List[Event]:
-        conn = sqlite3.connect(self.db_name)
+    def get_upcoming_events(self, num_events: int = 50, event_type: EventType = EventType.ALL, order_by: OrderBy = OrderBy.START, as_json: bool = False) -> Union[List[Event], List[dict]]:
+        columns = _SQL_JSON_COLUMNS if as_json else _SQL_EVENT_COLUMNS
+        conn = self.__connection()
         cursor = conn.cursor()
 
         # If event type is all, the is_flexible filter is not needed
         if event_type == EventType.ALL:
-            cursor.execute(f"""
-                                   SELECT summary, is_flexible, event_start_dt, event_end_dt, valid_start_dt, valid_end_dt, google_id
-                                   FROM events
-                                   WHERE event_end_dt >= ?
-                                   ORDER BY {order_by.value}
-                                   LIMIT ?""",
-                           (datetime.now().isoformat(), num_events,))
+            cursor.execute(_SQL_UPCOMING_ALL.format(columns=columns, order_by=order_by.value),
+                           (int(datetime.now().timestamp()), num_events,))
 
         else:
-            cursor.execute(f"""
-                                   SELECT summary, is_flexible, event_start_dt, event_end_dt, valid_start_dt, valid_end_dt, google_id
-                                   FROM events
-                                   WHERE (is_flexible = ?)
-                                    AND (event_end_dt >= ?)
-                                   ORDER BY {order_by.value}
-                                   LIMIT ?""",
-                           (event_type.value, datetime.now().isoformat(), num_events,))
+            cursor.execute(_SQL_UPCOMING_TYPED.format(columns=columns, order_by=order_by.value),
+                           (event_type.value, int(datetime.now().timestamp()), num_events,))
 
         # Create a list of events from the DB query results
+        if as_json:
+            return self.__create_json_from_db_query(cursor.fetchall())
         events = self.__create_event_from_db_query(cursor.fetchall())
-        conn.close()
 
         return events
 
-    def get_events_in_date_range(self, from_dt: datetime, to_dt: datetime, event_type: EventType = EventType.ALL, order_by: OrderBy = OrderBy.START) -> List[Event]:
+    def get_events_in_date_range(self, from_dt: datetime, to_dt: datetime, event_type: EventType = EventType.ALL, order_by: OrderBy = OrderBy.START, as_json: bool = False) -> Union[List[Event], List[dict]]:
         """
         Returns all events within the given time range
         :param from_dt: Start time
         :param to_dt: End time
         :param event_type: Types of events to return (Fixed, Flexible or all)
         :param order_by: Order by (start times or end times)
+        :param as_json: Return rows as Event.to_json style dicts built in SQL, rather than Event objects
         :return: List of events in range
         """
 
         if not from_dt < to_dt:
             raise ValueError("Start date/time must be before end date/time")
 
-        conn = sqlite3.connect(self.db_name)
+        columns = _SQL_JSON_COLUMNS if as_json else _SQL_EVENT_COLUMNS
+        conn = self.__connection()
         cursor = conn.cursor()
 
         #If event type is all, the is_flexible filter is not needed
         if event_type == EventType.ALL:
-            cursor.execute(f"""
-                           SELECT summary, is_flexible, event_start_dt, event_end_dt, valid_start_dt, valid_end_dt, google_id
-                           FROM events
-                           WHERE (event_start_dt BETWEEN ? AND ?)
-                            OR (? BETWEEN event_start_dt AND event_end_dt)
-                            OR (? BETWEEN event_start_dt AND event_end_dt)
-                           ORDER BY {order_by.value}""",
-                           (from_dt.isoformat(), to_dt.isoformat(), from_dt.isoformat(), to_dt.isoformat()))
+            cursor.execute(_SQL_RANGE_ALL.format(columns=columns, order_by=order_by.value),
+                           (int(to_dt.timestamp()), int(from_dt.timestamp())))
 
         else:
-            cursor.execute(f"""
-                           SELECT summary, is_flexible, event_start_dt, event_end_dt, valid_start_dt, valid_end_dt, google_id
-                           FROM events
-                           WHERE (is_flexible = ?)
-                            AND (
-                                (event_start_dt BETWEEN ? AND ?)
-                                OR (? BETWEEN event_start_dt AND event_end_dt)
-                                OR (? BETWEEN event_start_dt AND event_end_dt)
-                            )
-                           ORDER BY {order_by.value}""",
-                           (event_type.value, from_dt.isoformat(), to_dt.isoformat(), from_dt.isoformat(), to_dt.isoformat()))
+            cursor.execute(_SQL_RANGE_TYPED.format(columns=columns, order_by=order_by.value),
+                           (event_type.value, int(to_dt.timestamp()), int(from_dt.timestamp())))
 
         #Create a list of events from the DB query results
+        if as_json:
+            return self.__create_json_from_db_query(cursor.fetchall())
         events = self.__create_event_from_db_query(cursor.fetchall())
-        conn.close()
 
         return events
 
+    def get_event_intervals_in_range(self, from_dt: datetime, to_dt: datetime, as_timestamps: bool = False,
+                                     exclude_google_id: str = None) -> List[Tuple[Union[datetime, int], Union[datetime, int]]]:
+        """
+        Gets only the start and end times of the events overlapping the date range, without building Event objects
+        :param from_dt: Start of the date range
+        :param to_dt: End of the date range
+        :param as_timestamps: Return the stored Unix timestamps rather than building datetimes from them
+        :param exclude_google_id: Google ID of an event to leave out (e.g. the event being edited)
+        :return: List of (start, end) datetimes (or timestamps) in chronological order
+        """
+        conn = self.__connection()
+        cursor = conn.cursor()
+        if exclude_google_id is None:
+            cursor.execute(_SQL_RANGE_INTERVALS, (int(to_dt.timestamp()), int(from_dt.timestamp())))
+        else:
+            cursor.execute(_SQL_RANGE_INTERVALS_EXCLUDING, (int(to_dt.timestamp()), int(from_dt.timestamp()),
+                                                            exclude_google_id))
+
+        if as_timestamps:
+            return [(start, end) for start, end, _ in cursor.fetchall()]
+
+        intervals = []
+        for start, end, tz in cursor.fetchall():
+            tzinfo = _zone(tz)
+            intervals.append((datetime.fromtimestamp(start, tzinfo), datetime.fromtimestamp(end, tzinfo)))
+
+        return intervals
+
+    def count_events_in_date_range(self, from_dt: datetime, to_dt: datetime) -> Tuple[int, int]:
+        """
+        Counts the events within the given time range, without fetching them
+        :param from_dt: Start time
+        :param to_dt: End time
+        :return: Total number of events in range, number of those that are flexible
+        """
+
+        if not from_dt < to_dt:
+            raise ValueError("Start date/time must be before end date/time")
+
+        conn = self.__connection()
+        cursor = conn.cursor()
+
+        cursor.execute(_SQL_RANGE_COUNT, (int(to_dt.timestamp()), int(from_dt.timestamp())))
+
+        return cursor.fetchone()
+
     def get_event_by_google_id(self, google_id: str) -> Event:
         """
         Returns event with the given google_id
@@ -592,76 +1122,86 @@ class Database(metaclass=Singleton):
         :return: Event with given google_id
         """
 
-        conn = sqlite3.connect(self.db_name)
+        conn = self.__connection()
         cursor = conn.cursor()
 
-        cursor.execute('''
-                       SELECT summary, is_flexible, event_start_dt, event_end_dt, valid_start_dt, valid_end_dt, google_id
-                       FROM events
-                       WHERE google_id = ?
-                       LIMIT 1
-                       ''', (google_id,))
+        cursor.execute(_SQL_EVENT_BY_GOOGLE_ID, (google_id,))
 
         event_data = cursor.fetchone()
-        conn.close()
 
         if not event_data:
             raise ValueError(f"No event found with google_id {google_id}")
 
-        if event_data[1] == 0:
-            return FixedEvent(event_data[0], datetime.fromisoformat(event_data[2]), datetime.fromisoformat(event_data[3]), event_data[6])
-        else:
-            return FlexibleEvent(
-                event_data[0], datetime.fromisoformat(event_data[2]), datetime.fromisoformat(event_data[3]),
-                datetime.fromisoformat(event_data[4]), datetime.fromisoformat(event_data[5]), event_data[6])
+        return self.__create_event_from_db_query([event_data])[0]
 
 
-    def edit_event(self, event: Event, update_valid_window: bool = False) -> None:
+    def edit_event(self, event: Event, update_valid_window: bool = False, now: str = None) -> None:
         """
         Modifies an event's db metadata with that of the event passed as the argument
         :param event: Event with the updated metadata
         :param update_valid_window: Whether to also update the valid window of the event (for flexible events)
+        :param now: ISO timestamp to set as last updated, the current time if None
         :return: None
         """
 
-        #Check if the event has been modified
-        if self.event_status(event) != EventStatus.MODIFIED:
-            raise ValueError(f"Event {event.summary} has not been modified")
+        start = int(event.start_dt.timestamp())
+        end = int(event.end_dt.timestamp())
+        if now is None:
+            now = datetime.now().isoformat()
+
+        conn = self.__connection()
+        with conn:
+            cursor = conn.cursor()
+
+            #Update the event with new data, only if its metadata has been modified
+            cursor.execute(_SQL_EDIT_EVENT, (event.summary,
+                                             start,
+                                             end,
+                                             event.duration,
+                                             Timezone().timezone,
+                                             now,
+                                             event.google_id,
+                                             event.summary,
+                                             start,
+                                             end))
+
+            if cursor.fetchone() is None:
+                if not self._event_exists(event.google_id):
+                    raise ValueError(f"Event {event.summary} does not exist in the database")
+                raise ValueError(f"Event {event.summary} has not been modified")
+
+            #TODO: ensure updates to start/end time that lie outside the valid window also update the valid window accordingly
+            if update_valid_window:
+                cursor.execute(_SQL_EDIT_VALID_WINDOW, (int(event.valid_start_dt.timestamp()),
+                                                        int(event.valid_end_dt.timestamp()),
+                                                        event.google_id))
+
+
+    def convert_event(self, event: Event) -> None:
+        """
+        Overwrites an event's db row in place, including whether it is flexible and its valid window
+        (used when an event is switched between fixed and flexible)
+        :param event: Event with the updated metadata
+        :return: None
+        """
 
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        conn = self.__connection()
+        with conn:
+            cursor = conn.cursor()
+
+            cursor.execute(_SQL_CONVERT_EVENT, (event.summary,
+                                                int(event.is_flexible),
+                                                int(event.start_dt.timestamp()),
+                                                int(event.end_dt.timestamp()),
+                                                event.duration,
+                                                int(event.valid_start_dt.timestamp()),
+                                                int(event.valid_end_dt.timestamp()),
+                                                Timezone().timezone,
+                                                datetime.now().isoformat(),
+                                                event.google_id))
 
-        #Update the event with new data
-        cursor.execute('''
-                       UPDATE events
-                       SET summary = ?,
-                           event_start_dt = ?,
-                           event_end_dt   = ?,
-                           duration = ?,
-                           timezone = ?,
-                           last_updated = ?
-                       WHERE google_id = ?
-       ''', (event.summary,
-                        event.start_dt.isoformat(),
-                        event.end_dt.isoformat(),
-                        event.duration,
-                         Timezone().timezone,
-                        datetime.now().isoformat(),
-                        event.google_id),)
-
-        #TODO: ensure updates to start/end time that lie outside the valid window also update the valid window accordingly
-        if update_valid_window:
-            cursor.execute('''
-            UPDATE events
-            SET valid_start_dt = ?,
-                valid_end_dt = ?
-            WHERE google_id = ?
-                ''', (event.valid_start_dt.isoformat(),
-                                event.valid_end_dt.isoformat(),
-                                event.google_id),)
-
-        conn.commit()
-        conn.close()
+            if cursor.rowcount == 0:
+                raise ValueError(f"No event found with google_id {event.google_id}")
 
 
     def update_google_id(self, db_id: int, google_id: str) -> None:
@@ -671,23 +1211,74 @@ class Database(metaclass=Singleton):
         :param google_id: Google ID to add to event
         :return: None
         """
-        conn = sqlite3.connect(self.db_name)
+        conn = self.__connection()
+        with conn:
+            cursor = conn.cursor()
+
+            cursor.execute(_SQL_UPDATE_GOOGLE_ID, (google_id, db_id))
+
+    def data_version(self) -> int:
+        """
+        Returns a counter that changes whenever events are added, deleted or modified, by any process
+        :return: Current data version
+        """
+        return self.__connection().execute(_SQL_GET_DATA_VERSION).fetchone()[0]
+
+    def get_sync_token(self, calendar_id: str) -> Optional[str]:
+        """
+        Returns the sync token stored after the last Google Calendar sync
+        :param calendar_id: Google calendar ID
+        :return: Sync token, or None if the calendar has not been synced yet
+        """
+        conn = self.__connection()
         cursor = conn.cursor()
 
-        cursor.execute('''
-                       UPDATE events
-                       SET google_id = ?
-                       WHERE id = ?
-                       ''', (google_id, db_id))
+        cursor.execute(_SQL_GET_SYNC_TOKEN, (calendar_id,))
+
+        row = cursor.fetchone()
 
-        conn.commit()
-        conn.close()
+        return row[0] if row else None
+
+    def set_sync_token(self, calendar_id: str, sync_token: str) -> None:
+        """
+        Stores the sync token returned by the latest Google Calendar sync
+        :param calendar_id: Google calendar ID
+        :param sync_token: Sync token to store
+        :return: None
+        """
+        conn = self.__connection()
+        with conn:
+            cursor = conn.cursor()
+
+            cursor.execute(_SQL_SET_SYNC_TOKEN, (calendar_id, sync_token))
+
+# Partial response mask for events().list, only the parts of each event that __to_event_object and the deleted event
+# checks read are returned, along with the paging and sync tokens. The API sends (and the client parses) far less JSON
+_EVENT_LIST_FIELDS = "nextPageToken,nextSyncToken,items(id,summary,status,start(dateTime,date),end(dateTime,date))"
 
 class GoogleCalendar(metaclass=Singleton):
     def __init__(self):
         self.scopes = ["https://www.googleapis.com/auth/calendar"]
         self.creds = self.__authenticate()
         self.calendar_id = "primary"
+        self.__local = threading.local()
+
+    @property
+    def service(self):
+        """
+        Calling thread's Calendar API service, built on first use and reused by every request from that thread so
+        discovery and HTTP setup happen once. Each thread gets its own, as httplib2 connections are not thread safe
+        :return: Google Calendar API service
+        """
+        service = getattr(self.__local, "service", None)
+        if service is None:
+            # The authorised Http keeps its connections alive, so requests reuse the TLS session rather than
+            # handshaking each time. The discovery document bundled with the client library is used rather than
+            # fetching it over the network
+            http = AuthorizedHttp(self.creds, http=httplib2.Http())
+            service = build("calendar", "v3", http=http, static_discovery=True, cache_discovery=False)
+            self.__local.service = service
+        return service
 
     def __authenticate(self):
         # Creates the json access and refresh tokens to authenticate user to the application
@@ -727,7 +1318,7 @@ class GoogleCalendar(metaclass=Singleton):
         end_str = event_json["end"].get("dateTime", event_json["end"].get("date"))
         event_id = event_json["id"]
 
-        return FixedEvent(summary, datetime.fromisoformat(start_str), datetime.fromisoformat(end_str), event_id)
+        return FixedEvent(summary, _parse_iso(start_str), _parse_iso(end_str), event_id)
 
 
     def add_event(self, event: Event) -> str:
@@ -758,9 +1349,9 @@ class GoogleCalendar(metaclass=Singleton):
         }
         # Send API call to insert event into the calendar
         try:
-            service = build("calendar", "v3", credentials=self.creds)
+            service = self.service
             response = service.events().insert(calendarId=self.calendar_id, body=event_json).execute()
-            print(f"Event created: {response.get('htmlLink')}")
+            logger.debug("Event created: %s", response.get('htmlLink'))
 
             return response.get('id')
 
@@ -768,14 +1359,19 @@ class GoogleCalendar(metaclass=Singleton):
             print(f"An error occurred: {error}")
             sys.exit(1)
 
-    def __get_events_json(self, start_dt: datetime = datetime.now(), end_dt: datetime = None, get_deleted=False, in_range: bool = False, max_results: int = 50) -> List[dict]:
+    def __get_events_json(self, start_dt: datetime = None, end_dt: datetime = None, get_deleted=False, in_range: bool = False, max_results: int = 2500) -> List[dict]:
         """
         Fetches JSON of events in a given time range from Google Calendar API
-        :param start_dt: Start datetime
+        :param start_dt: Start datetime, defaults to now
         :param end_dt: End datetime
+        :param max_results: Most events to return in total. Pages are followed until this many are collected (each page
+                            holds at most 2500, the most the API allows)
         :return: List of events in JSON format
         """
 
+        if start_dt is None:
+            start_dt = datetime.now()
+
         start_formatted = start_dt.isoformat() + 'Z'
         end_formatted = None
 
@@ -786,36 +1382,52 @@ class GoogleCalendar(metaclass=Singleton):
             end_formatted = end_dt.isoformat() + 'Z'
 
         try:
-            service = build("calendar", "v3", credentials=self.creds)
-
-            # Send request to API to return list of events on chosen day
-            events_result = service.events().list(
-                calendarId=GoogleCalendar().calendar_id,
-                timeMin=start_formatted,
-                timeMax=end_formatted,
-                maxResults=max_results,
-                singleEvents=True,
-                showDeleted=get_deleted,
-                orderBy='startTime'
-            ).execute()
+            service = self.service
+
+            # Send requests to API to return list of events on chosen day, following the pages of results
+            events_json = []
+            page_token = None
+            while True:
+                events_result = service.events().list(
+                    calendarId=self.calendar_id,
+                    timeMin=start_formatted,
+                    timeMax=end_formatted,
+                    maxResults=min(max_results - len(events_json), 2500),
+                    singleEvents=True,
+                    showDeleted=get_deleted,
+                    orderBy='startTime',
+                    pageToken=page_token,
+                    fields=_EVENT_LIST_FIELDS
+                ).execute()
+
+                # Generate list from JSON return body
+                events_json.extend(events_result.get('items', []))
+                page_token = events_result.get('nextPageToken')
+                # Without a timeMax every future event matches, so paging stops at the cap
+                if not page_token or len(events_json) >= max_results:
+                    break
+
+            del events_json[max_results:]
 
-            # Generate list from JSON return body
-            events_json = events_result.get('items', [])
             return events_json
 
         except HttpError as error:
             print(f"An HTTP error occurred: {error}")
             sys.exit(1)
 
-    def get_events(self, start_dt: datetime = datetime.now(), end_dt: datetime = None, in_range: bool = False) -> tuple[List[FixedEvent], List[FixedEvent]]:
+    def get_events(self, start_dt: datetime = None, end_dt: datetime = None, in_range: bool = False) -> tuple[List[FixedEvent], List[FixedEvent]]:
         """
         Returns list of current and deleted events in a given time range from the Google Calendar
         :param in_range: Whether to get events in a specific time range
-        :param start_dt: Start datetime
+        :param start_dt: Start datetime, defaults to now
         :param end_dt: End datetime
         :return: Tuple: List of current events, List of deleted events
         """
 
+        #Default is resolved per call, a datetime.now() default would be frozen at import time
+        if start_dt is None:
+            start_dt = datetime.now()
+
         if in_range and not start_dt < end_dt:
             raise ValueError("Start date/time must be before end date/time")
 
@@ -832,6 +1444,51 @@ class GoogleCalendar(metaclass=Singleton):
                 current_events.append(self.__to_event_object(event))
         return current_events, deleted_events
 
+    def get_event_changes(self, sync_token: str = None) -> Tuple[List[FixedEvent], List[str], str]:
+        """
+        Returns the events that have changed in the Google Calendar since the sync token was issued. If no sync token is
+        given, every event in the calendar is returned (a full sync)
+        Raises HttpError with status 410 if the sync token has expired, in which case a full sync is needed
+        :param sync_token: Sync token from the previous sync
+        :return: Tuple: List of current events, List of deleted event IDs, Sync token for the next sync
+        """
+
+        current_events = []
+        deleted_ids = []
+        page_token = None
+
+        try:
+            service = self.service
+
+            # Page through the results - the next sync token is only returned with the last page
+            while True:
+                events_result = service.events().list(
+                    calendarId=self.calendar_id,
+                    syncToken=sync_token,
+                    pageToken=page_token,
+                    maxResults=2500,
+                    singleEvents=True,
+                    showDeleted=True,
+                    fields=_EVENT_LIST_FIELDS
+                ).execute()
+
+                for event in events_result.get('items', []):
+                    # Deleted events may only contain their ID and status
+                    if event['status'] == 'cancelled':
+                        deleted_ids.append(event['id'])
+                    else:
+                        current_events.append(self.__to_event_object(event))
+
+                page_token = events_result.get('nextPageToken')
+                if not page_token:
+                    return current_events, deleted_ids, events_result.get('nextSyncToken')
+
+        except HttpError as error:
+            if error.resp.status == 410:
+                raise
+            print(f"An HTTP error occurred: {error}")
+            sys.exit(1)
+
     def event_exists(self, event_id: str) -> bool:
         """
         Checks if an event with the given event_id exists in the Google Calendar.
@@ -839,7 +1496,7 @@ class GoogleCalendar(metaclass=Singleton):
         :return: True if the event exists, False otherwise.
         """
         try:
-            service = build("calendar", "v3", credentials=self.creds)
+            service = self.service
             service.events().get(calendarId=self.calendar_id, eventId=event_id).execute()
             return True
         except HttpError as error:
@@ -848,35 +1505,74 @@ class GoogleCalendar(metaclass=Singleton):
             else:
                 raise
 
-    def edit_event(self, event: Event) -> None:
+    def __patch_request(self, event: Event):
         """
-        Update details of event in Google Calendar
+        Creates the (unexecuted) API request that patches an event with its new details
         :param event: Event with new details
-        :return: None
+        :return: Patch request, to execute directly or add to a batch
         """
-        if not self.event_exists(event.google_id):
-            raise ValueError(f"Event {event.summary} does not exist in Google Calendar")
-
-
-        service = build("calendar", "v3", credentials=self.creds)
-
-        #Patch Request with new data
-        service.events().patch(
+        timezone = Timezone().timezone
+        return self.service.events().patch(
             calendarId=self.calendar_id,
             eventId=event.google_id,
             body={
                 "summary": event.summary,
                 "start": {
                     "dateTime": event.start_dt.isoformat(),
-                    "timeZone": Timezone().timezone,
+                    "timeZone": timezone,
                 },
                 "end": {
                     "dateTime": event.end_dt.isoformat(),
-                    "timeZone": Timezone().timezone,
+                    "timeZone": timezone,
                 }
             }
-        ).execute()
-        print(f"Event {event.summary} updated")
+        )
+
+    def edit_event(self, event: Event) -> None:
+        """
+        Update details of event in Google Calendar
+        :param event: Event with new details
+        :return: None
+        """
+        #Patch Request with new data, a missing event is reported by the API as a 404
+        try:
+            self.__patch_request(event).execute()
+        except HttpError as error:
+            if error.resp.status == 404:
+                raise ValueError(f"Event {event.summary} does not exist in Google Calendar")
+            raise
+        logger.debug("Event %s updated", event.summary)
+
+    def edit_events_batch(self, events: List[Event]) -> dict:
+        """
+        Updates several events in the Google Calendar, sending the patches as batch requests rather than one request each
+        :param events: Events with new details
+        :return: Dictionary of google_id to error for the patches that failed (empty if every patch succeeded)
+        """
+        failed = {}
+
+        # Each patch is added with its event's google_id as the request ID, so failures can be traced to their event
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                failed[request_id] = exception
+
+        service = self.service
+
+        # The Calendar API accepts up to 50 requests per batch
+        for chunk_start in range(0, len(events), 50):
+            chunk = events[chunk_start:chunk_start + 50]
+            batch = service.new_batch_http_request(callback=on_response)
+            for event in chunk:
+                batch.add(self.__patch_request(event), request_id=event.google_id)
+            try:
+                batch.execute()
+            except HttpError as error:
+                # The whole batch request failed, so none of its patches were applied
+                for event in chunk:
+                    failed[event.google_id] = error
+
+        logger.debug("%d events updated", len(events) - len(failed))
+        return failed
 
     def delete_event(self, event: Event) -> None:
         """
@@ -884,15 +1580,17 @@ class GoogleCalendar(metaclass=Singleton):
         :param event: Event to delete
         :return: None
         """
-        if not self.event_exists(event.google_id):
-            raise ValueError(f"Event {event.summary} does not exist in Google Calendar")
-
-        service = build("calendar", "v3", credentials=self.creds)
+        service = self.service
 
-        service.events().delete(
-            calendarId=self.calendar_id,
-            eventId=event.google_id
-        ).execute()
+        try:
+            service.events().delete(
+                calendarId=self.calendar_id,
+                eventId=event.google_id
+            ).execute()
+        except HttpError as error:
+            if error.resp.status == 404:
+                raise ValueError(f"Event {event.summary} does not exist in Google Calendar")
+            raise
 
         print(f"Event {event.summary} deleted from Google Calendar")
 
@@ -901,33 +1599,57 @@ class EventManager:
     Class to manage alignment of events in Google calendar and database
     """
     @staticmethod
-    def sync_gc_to_db(in_range: bool = False, start_dt: datetime = datetime.now(), end_dt: datetime = None) -> None:
+    def sync_gc_to_db() -> None:
         """
-        Adds existing events from the Google calendar in a given time range to the DB
-        :param in_range: Whether to sync events in a specific time range
-        :param start_dt: Start datetime
-        :param end_dt: End datetime
+        Syncs changes in the Google calendar to the DB. Only events changed since the last sync are fetched, using the
+        stored sync token. A full sync is done if there is no sync token yet or if Google has expired it
         :return: None
         """
-        # Get list of all events on day from Google calendar
-        cur_events, del_events = GoogleCalendar().get_events(start_dt, end_dt, in_range=in_range)
-
-        if not cur_events and not del_events:
-            raise ValueError("No events found in Google Calendar in the given time range")
+        db = Database()
+        gc = GoogleCalendar()
+        calendar_id = gc.calendar_id
+        sync_token = db.get_sync_token(calendar_id)
 
-        #Sync to DB
+        if sync_token:
+            try:
+                cur_events, del_ids, next_sync_token = gc.get_event_changes(sync_token)
+            except HttpError as error:
+                # 410 GONE means the sync token is no longer valid
+                if error.resp.status != 410:
+                    raise
+                print("Sync token expired, performing a full sync")
+                sync_token = None
+
+        if not sync_token:
+            cur_events, del_ids, next_sync_token = gc.get_event_changes()
+
+            if not cur_events and not del_ids:
+                raise ValueError("No events found in Google Calendar")
+
+            #A full sync only lists the events that exist now, events deleted while there was no valid sync token are
+            #not reported as deleted. Any stored event missing from the result is removed
+            db.del_events_not_in([event.google_id for event in cur_events])
+
+        #Sync to DB, statuses are looked up together and new events are added together in one transaction. Every write
+        #in the sync shares one last updated timestamp
+        now = datetime.now().isoformat()
+        statuses = db.event_statuses(cur_events, now)
+        new_events = []
         for event in cur_events:
-            if Database().event_status(event) == EventStatus.NEW:
-                Database().add_event(event)
-            elif Database().event_status(event) == EventStatus.MODIFIED:
+            status = statuses[event.google_id]
+            if status is EventStatus.NEW:
+                new_events.append(event)
+            elif status is EventStatus.MODIFIED:
                 #find valid start and end times, update first to prevent overwriting
-                Database().edit_event(event)
+                db.edit_event(event, now=now)
 
-        for event in del_events:
-            try:
-                Database().del_event(event)
-            except ValueError as error:
-                print(error)
+        if new_events:
+            db.add_events(new_events, now)
+
+        if del_ids:
+            db.del_events_by_google_id(del_ids)
+
+        db.set_sync_token(calendar_id, next_sync_token)
 
     @staticmethod
     def submit_event(event) -> None:
@@ -936,23 +1658,60 @@ class EventManager:
         :param event: Event to add to calendar and db
         :return: None
         """
-        # Add event to database, return whether it was added successfully
-        try:
-            db_id = Database().add_event(event)
-        except ValueError as e:
-            print(e)
-            sys.exit(1)
-        #If event was added to the DB successfully, add to the Google Calendar
+        # The event is added to the calendar first, so it is written to the DB once with its google_id rather than
+        # inserted and then updated in a second transaction
+        event.google_id = GoogleCalendar().add_event(event)
 
-        google_id = GoogleCalendar().add_event(event)
-        Database().update_google_id(db_id, google_id)
-        print(f"Submitted event {event.summary}")
+        db = Database()
+        try:
+            db.add_event(event)
+        except ValueError:
+            # A sync that ran between the calendar insert and this write has already stored the new event (as a
+            # fixed event, from Google's copy), so its row is overwritten with the submitted event instead
+            db.convert_event(event)
+        logger.debug("Submitted event %s", event.summary)
 
     @staticmethod
     def edit_event(event: Event, update_valid_window: bool = False) -> None:
         Database().edit_event(event, update_valid_window=update_valid_window)
         GoogleCalendar().edit_event(event)
 
+    @staticmethod
+    def edit_events(events: List[Event]) -> None:
+        """
+        Pushes several modified events to google calendar in batches, then updates the database for those that were
+        patched successfully, so the two stay in sync if part of a batch fails
+        Raises ValueError naming the events that could not be updated in google calendar
+        :param events: Events with new details
+        :return: None
+        """
+        if not events:
+            return
+
+        failed = GoogleCalendar().edit_events_batch(events)
+
+        db = Database()
+        now = datetime.now().isoformat()
+        for event in events:
+            if event.google_id not in failed:
+                db.edit_event(event, now=now)
+
+        if failed:
+            raise ValueError(f"{len(failed)} events could not be updated in Google Calendar: "
+                             + ", ".join(f"{google_id} ({error})" for google_id, error in failed.items()))
+
+    @staticmethod
+    def convert_event(existing_event: Event, updated_event: Event) -> None:
+        """
+        Switches an event between fixed and flexible in place, rather than deleting and re-adding it
+        :param existing_event: Event as currently stored
+        :param updated_event: Event with the new metadata
+        :return: None
+        """
+        updated_event.google_id = existing_event.google_id
+        Database().convert_event(updated_event)
+        GoogleCalendar().edit_event(updated_event)
+
     @staticmethod
     def delete_event(event: Event) -> None:
         Database().del_event(event)
@@ -962,42 +1721,61 @@ class EventManager:
 class DateTimeConverter:
     """
     Handles data type conversion of times
+    The string parsers are memoised, since the same user inputs recur and times/dates are immutable
     """
     @staticmethod
+    @lru_cache(maxsize=512)
     def convert_str_to_time(time_str: str) -> time:
         """
         Converts string input in the format HH:MM into timezone.time object
         :param time_str: String representation of the time
         :return: time object representation of the time
         """
+        # The hour and minute are split out and converted directly rather than going through strptime, accepting the
+        # same 1-2 digit fields as %H:%M
         try:
-            return datetime.strptime(time_str, "%H:%M").time()
+            fields = time_str.split(":")
+            if len(fields) != 2 or not all(1 <= len(f) <= 2 and f.isascii() and f.isdigit() for f in fields):
+                raise ValueError(f"time data '{time_str}' does not match format '%H:%M'")
+            return time(int(fields[0]), int(fields[1]))
         except ValueError as e:
             print(f"Invalid time format: {e}")
             sys.exit(1)
 
     @staticmethod
+    @lru_cache(maxsize=512)
     def convert_str_to_date(date_str: str) -> date:
         """
         Converts string input in the format dd-mm-YYYY to a datetime.date object
         :param date_str: string representation of the date (in dd-mm-YYYY format)
         :return: date object representation of the date
         """
+        # Split and converted directly rather than going through strptime, accepting the same 1-2 digit day and month
+        # and 4 digit year as %d-%m-%Y
         try:
-            return datetime.strptime(date_str, "%d-%m-%Y").date()
+            fields = date_str.split("-")
+            if (len(fields) != 3 or not all(f.isascii() and f.isdigit() for f in fields)
+                    or not (1 <= len(fields[0]) <= 2 and 1 <= len(fields[1]) <= 2 and len(fields[2]) == 4)):
+                raise ValueError(f"time data '{date_str}' does not match format '%d-%m-%Y'")
+            return date(int(fields[2]), int(fields[1]), int(fields[0]))
         except ValueError as e:
             print(f"Invalid date format: {e}")
             sys.exit(1)
 
     @staticmethod
+    @lru_cache(maxsize=512)
     def convert_str_to_dt(date_str: str) -> datetime:
         """
         Converts string input in the format dd-mm-YYYY to a datetime.datetime object
         :param date_str: string representation of the date (in dd-mm-YYYY format)
         :return: datetime object representation of the date
         """
+        # dd-mm-YYYY has a fixed layout, so the fields are sliced out directly rather than going through strptime
         try:
-            return datetime.strptime(date_str, "%d-%m-%Y")
+            digits = date_str[:2] + date_str[3:5] + date_str[6:]
+            if len(date_str) != 10 or date_str[2] != "-" or date_str[5] != "-" or not (digits.isascii() and digits.isdigit()):
+                raise ValueError(f"time data '{date_str}' does not match format '%d-%m-%Y'")
+            return datetime(int(date_str[6:]), int(date_str[3:5]), int(date_str[:2]))
         except ValueError as e:
             print(f"Invalid date format: {e}")
             sys.exit(1)
@@ -1029,6 +1807,8 @@ class FlexEventOptimiser:
         self.mins_in_day = 1440
         self.precision = precision
         self.num_slots = self.mins_in_day // self.precision
+        # Last solution found for each day ({date: {google_id: start_slot}}), used to warm start the next solve
+        self.last_solutions = {}
 
     def convert_time_to_slot(self, dt: datetime):
         mins_after_midnight = dt.hour * 60 + dt.minute
@@ -1041,20 +1821,20 @@ class FlexEventOptimiser:
         return hour, minute
 
     def preprocess_events(self, events_list: List[Event]) -> dict:
-        processed_events = {}
+        precision = self.precision
         #Convert event start time, end time, and duration into time slots and store in dictionary of events
-        for event in events_list:
-            start_slot = self.convert_time_to_slot(event.valid_start_dt)
-            end_slot = self.convert_time_to_slot(event.valid_end_dt)
-            duration_slot = event.duration // self.precision
-            processed_events[event] = (duration_slot, start_slot, end_slot)
-
-        return processed_events
+        #(same maths as convert_time_to_slot, inlined to avoid a method call per datetime)
+        return {
+            event: (event.duration // precision,
+                    (event.valid_start_dt.hour * 60 + event.valid_start_dt.minute) // precision,
+                    (event.valid_end_dt.hour * 60 + event.valid_end_dt.minute) // precision)
+            for event in events_list
+        }
 
     def run_ILP_optimiser(self, dt: datetime):
         # Get current and next midnight (the start and end time for the day we are optimising)
-        cur_midnight = DateTimeConverter().get_cur_midnight(dt)
-        next_midnight = DateTimeConverter().get_next_midnight(dt)
+        cur_midnight = DateTimeConverter.get_cur_midnight(dt)
+        next_midnight = DateTimeConverter.get_next_midnight(dt)
 
         events_list = Database().get_events_in_date_range(cur_midnight, next_midnight, EventType.ALL, OrderBy.START)
 
@@ -1064,70 +1844,96 @@ class FlexEventOptimiser:
         #Create minimisation problem
         model = pulp.LpProblem("Minimise_Event_Clashes", pulp.LpMinimize)
 
+        #Start slots each event can take while staying inside its valid time range
+        valid = {i: range(start_slot, end_slot - duration_slot + 1)
+                 for i, (duration_slot, start_slot, end_slot) in processed_events.items()}
+
         #Set up decision variables
-        #x[i,t] = 1 if event i starts at time slot t, 0 otherwise
+        #x[i,t] = 1 if event i starts at time slot t, 0 otherwise (only for valid start slots)
         x = pulp.LpVariable.dicts(
             "x",
-            ((i, t) for i in processed_events for t in range(self.num_slots)),
+            ((i, t) for i, slots in valid.items() for t in slots),
             cat='Binary'
         )
 
+        #Pairs of events whose valid ranges intersect, as only they can ever overlap. Found with a sweep over the events
+        #in start order: the valid start slots are kept in their own sorted list, so the events that start before the
+        #current one's valid range ends are found with a binary search rather than compared one at a time
+        by_start = sorted(processed_events.items(), key=lambda item: item[1][1])
+        start_slots = [data[1] for _, data in by_start]
+        pairs = []
+        for k, (i, data_i) in enumerate(by_start):
+            stop = bisect_left(start_slots, data_i[2], k + 1)
+            pairs.extend(((i, data_i), by_start[m]) for m in range(k + 1, stop))
+
         #o[i,j] = 1 if event i overlaps with event j, 0 otherwise
         o = pulp.LpVariable.dicts(
             "o",
-            ((i, j) for i in processed_events for j in processed_events if i.google_id < j.google_id),
+            ((i, j) for (i, _), (j, _) in pairs),
             cat='Binary'
         )
 
         #Constraints
         #Each event should be scheduled exactly once within its valid time range
-        for i, data in processed_events.items():
-            duration_slot, start_slot, end_slot = data
-            model += (pulp.lpSum(x[i, t] for t in range(start_slot, end_slot - duration_slot + 1)) == 1,
+        for i, slots in valid.items():
+            model += (pulp.lpSum(x[i, t] for t in slots) == 1,
                       f"Event_{i}_scheduled_once")
 
         #No overlapping events
-        for i, data_i in processed_events.items():
-            for j, data_j in processed_events.items():
-                if i.google_id >= j.google_id:
-                    continue
-
-                duration_i, start_i, end_i = data_i
-                duration_j, start_j, end_j = data_j
-
-                for t_i in range(start_i, end_i + 1):
-                    for t_j in range(start_j, end_j + 1):
-                        if (t_i < t_j + duration_j) and (t_j < t_i + duration_i):
-                            model += (o[i, j] >= x[i, t_i] + x[j, t_j] -1,
-                                      f"Overlap_{i}_{j}_at_{t_i}_{t_j}")
+        #Two events overlap exactly when some slot is covered by both, so one constraint per shared slot is enough
+        #(rather than one per pair of start slots). Event i covers slot t if it starts in (t - duration_i, t]
+        def covering_starts(data, t):
+            duration_slot, start_slot, end_slot = data
+            return range(max(start_slot, t - duration_slot + 1), min(end_slot - duration_slot, t) + 1)
+
+        for (i, data_i), (j, data_j) in pairs:
+            # Only slots both events can cover are checked, pairs with disjoint valid ranges get no constraints
+            for t in range(max(data_i[1], data_j[1]), min(data_i[2], data_j[2])):
+                cover_i = covering_starts(data_i, t)
+                cover_j = covering_starts(data_j, t)
+                if cover_i and cover_j:
+                    model += (o[i, j] >= pulp.lpSum(x[i, t_i] for t_i in cover_i)
+                              + pulp.lpSum(x[j, t_j] for t_j in cover_j) - 1,
+                              f"Overlap_{i}_{j}_at_{t}")
 
         #Objective function: Minimise total overlaps
         model += pulp.lpSum(o[i, j] for i, j in o), "Minimise_Total_Overlaps"
 
+        #Warm start from the previous solution for this day, for events whose old start slot is still valid
+        last_solution = self.last_solutions.get(cur_midnight.date(), {})
+        warm_start = False
+        for i, slots in valid.items():
+            hint_slot = last_solution.get(i.google_id)
+            if hint_slot in slots:
+                warm_start = True
+                for t in slots:
+                    x[i, t].setInitialValue(1 if t == hint_slot else 0)
+
         # solve the ILP model
-        solver = pulp.PULP_CBC_CMD()
+        solver = pulp.PULP_CBC_CMD(warmStart=warm_start)
         model.solve(solver)
 
-        print("Status:", pulp.LpStatus[model.status])
-        print("Total overlaps:", pulp.value(model.objective))
+        logger.debug("Status: %s, total overlaps: %s", pulp.LpStatus[model.status], pulp.value(model.objective))
 
         #return list of events with their assigned optimal start times
-        for i in processed_events:
-            for t in range(self.num_slots):
-                if pulp.value(x[i, t]) == 1:
-                    hour, minute = self.convert_slot_to_time(t)
-                    duration = i.duration
-                    print(f"Event {i.summary} starts at slot {t} and ends at slot {t + processed_events[i][0]}")
-                    i.start_dt = i.start_dt.replace(hour=hour, minute=minute)
-                    print(f"Event {i.summary} starts at {i.start_dt.hour:02}:{i.start_dt.minute:02}")
-                    i.end_dt = i.start_dt + timedelta(minutes=duration)
-                    print(f"Event {i.summary} ends at {i.end_dt.hour:02}:{i.end_dt.minute:02}")
-
-
-        for i, j in o:
-            if pulp.value(o[i, j]) == 1:
-                print(f"Event {i.summary} overlaps with event {j.summary}")
-
+        #Each event has exactly one chosen start slot, read straight from the variables' solved values
+        chosen = {i: t for (i, t), var in x.items() if var.varValue is not None and var.varValue > 0.5}
+
+        solution = {}
+        for i, t in chosen.items():
+            solution[i.google_id] = t
+            hour, minute = self.convert_slot_to_time(t)
+            i.reschedule(i.start_dt.replace(hour=hour, minute=minute))
+            logger.debug("Event %s scheduled at slot %d (%s to %s)", i.summary, t,
+                         i.start_dt.strftime("%H:%M"), i.end_dt.strftime("%H:%M"))
+
+        #The overlap variables are only walked when they will be logged
+        if logger.isEnabledFor(logging.DEBUG):
+            for (i, j), var in o.items():
+                if var.varValue is not None and var.varValue > 0.5:
+                    logger.debug("Event %s overlaps with event %s", i.summary, j.summary)
+
+        self.last_solutions[cur_midnight.date()] = solution
 
         return list(processed_events.keys())
 
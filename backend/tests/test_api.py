@@ -0,0 +1,237 @@
+import asyncio
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from unittest.mock import patch, MagicMock, AsyncMock
+
+import orjson
+from fastapi.testclient import TestClient
+
+import scheduler
+from app import OptimisationDebouncer, RequestHandler
+
+# The module level RequestHandler is replaced, so importing the API doesn't open events.db
+with patch("app.RequestHandler"):
+    import api
+
+_DT = datetime(2025, 8, 5, 9, 0)
+
+_EVENT_JSON = {"summary": "Gym", "start_time": "2025-08-05T09:00", "end_time": "2025-08-05T10:00",
+               "is_flexible": False}
+
+
+def _make_event_dicts(n):
+    return [{"summary": f"Event {i}", "date": "2025-08-05", "start_time": "09:00", "end_time": "10:00",
+             "earliest_start": "09:00", "latest_end": "10:00", "duration_minutes": 60, "is_flexible": False,
+             "google_id": f"id_{i}"} for i in range(n)]
+
+
+class TestEventsApi(unittest.TestCase):
+    def setUp(self):
+        self.rh = MagicMock()
+        self.rh.db.data_version.return_value = 1
+        self.rh.get_events.return_value = _make_event_dicts(2)
+        rh_patcher = patch.object(api, "rh", self.rh)
+        rh_patcher.start()
+        self.addCleanup(rh_patcher.stop)
+
+        self.debouncer = MagicMock()
+        self.debouncer.request = AsyncMock()
+        debouncer_patcher = patch.object(api, "optimisation_debouncer", self.debouncer)
+        debouncer_patcher.start()
+        self.addCleanup(debouncer_patcher.stop)
+
+        api.events_cache.clear()
+        self.addCleanup(api.events_cache.clear)
+        self.client = TestClient(api.app)
+
+    def test_get_events_returns_etag_and_304_when_unchanged(self):
+        response = self.client.get("/events")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/json")
+        self.assertEqual(response.json(), {"events": _make_event_dicts(2)})
+        etag = response.headers["etag"]
+        self.assertRegex(etag, r'^"[0-9a-f]{16}"$')
+
+        response = self.client.get("/events", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["etag"], etag)
+        self.assertEqual(response.content, b"")
+
+        # A stale ETag gets the full body again
+        response = self.client.get("/events", headers={"If-None-Match": '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["etag"], etag)
+
+    def test_get_events_cache_is_keyed_on_params_and_data_version(self):
+        self.client.get("/events")
+        self.client.get("/events")
+        # The second request is served from the cache, without a sync
+        self.assertEqual(self.rh.get_events.call_count, 1)
+
+        self.client.get("/events", params={"in_range": True, "from_date": "2025-08-05T00:00",
+                                           "to_date": "2025-08-06T00:00"})
+        self.assertEqual(self.rh.get_events.call_count, 2)
+        self.rh.get_events.assert_called_with(True, datetime(2025, 8, 5), datetime(2025, 8, 6))
+
+        # A write through any worker bumps the data version, so the cached entry is no longer used
+        self.rh.db.data_version.return_value = 2
+        self.rh.get_events.return_value = _make_event_dicts(3)
+        response = self.client.get("/events")
+        self.assertEqual(self.rh.get_events.call_count, 3)
+        self.assertEqual(len(response.json()["events"]), 3)
+
+    def test_get_events_in_range_requires_both_dates(self):
+        response = self.client.get("/events", params={"in_range": True, "from_date": "2025-08-05T00:00"})
+        self.assertEqual(response.status_code, 422)
+        self.rh.get_events.assert_not_called()
+
+    def test_get_events_streams_large_results_without_caching(self):
+        events = _make_event_dicts(api.STREAM_THRESHOLD + 1)
+        self.rh.get_events.return_value = events
+
+        response = self.client.get("/events")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/json")
+        self.assertNotIn("etag", response.headers)
+        self.assertEqual(orjson.loads(response.content), {"events": events})
+
+        # Streamed responses are not cached, so the next request fetches again
+        self.client.get("/events")
+        self.assertEqual(self.rh.get_events.call_count, 2)
+
+    def test_add_event_returns_202_and_schedules_optimisation(self):
+        self.rh.add_event.return_value = _DT
+
+        response = self.client.post("/events", json=_EVENT_JSON)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {"message": "Event Gym added successfully"})
+        self.assertEqual(self.rh.add_event.call_args.args[0]["summary"], "Gym")
+        self.debouncer.request.assert_awaited_once_with(_DT)
+
+    def test_add_event_skips_optimisation_when_day_has_nothing_to_move(self):
+        self.rh.add_event.return_value = None
+
+        response = self.client.post("/events", json=_EVENT_JSON)
+        self.assertEqual(response.status_code, 202)
+        self.debouncer.request.assert_not_awaited()
+
+    def test_edit_event_returns_202_and_schedules_optimisation(self):
+        self.rh.edit_event.return_value = _DT
+
+        response = self.client.put("/events/id_1", json=_EVENT_JSON)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {"message": "Event id_1 edited successfully"})
+        self.assertEqual(self.rh.edit_event.call_args.args[0], "id_1")
+        self.debouncer.request.assert_awaited_once_with(_DT)
+
+    def test_writes_clear_the_events_cache(self):
+        self.client.get("/events")
+        self.rh.del_event.return_value = None
+
+        response = self.client.delete("/events/id_1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"message": "Event id_1 deleted successfully"})
+        self.assertEqual(len(api.events_cache), 0)
+
+
+class TestBackgroundOptimisation(unittest.TestCase):
+    def setUp(self):
+        self.rh = MagicMock()
+        self.rh.add_event.return_value = _DT
+        rh_patcher = patch.object(api, "rh", self.rh)
+        rh_patcher.start()
+        self.addCleanup(rh_patcher.stop)
+
+        # Solves run in a thread rather than a spawned process, so solve_day can be mocked
+        pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(pool.shutdown)
+        api.app.state.opt_pool = pool
+        self.addCleanup(delattr, api.app.state, "opt_pool")
+
+    @patch.object(api.optimisation_debouncer, "delay", 0)
+    @patch("api.solve_day")
+    def test_add_event_solves_day_and_applies_result_after_response(self, mock_solve_day):
+        processed_events = [scheduler.FixedEvent("Moved", _DT, _DT.replace(hour=10), "id_1")]
+        mock_solve_day.return_value = processed_events
+        api.events_cache["stale"] = ("etag", b"")
+
+        response = TestClient(api.app).post("/events", json=_EVENT_JSON)
+
+        self.assertEqual(response.status_code, 202)
+        mock_solve_day.assert_called_once_with(_DT.isoformat())
+        self.rh.apply_optimised_events.assert_called_once_with(processed_events)
+        self.assertEqual(len(api.events_cache), 0)
+
+
+class TestOptimisationDebouncer(unittest.TestCase):
+    def test_requests_are_coalesced_and_rerun_once_after_a_running_solve(self):
+        runs = []
+        running = []
+
+        async def optimise(dt):
+            running.append(dt)
+            # Never more than one solve of a day at a time
+            self.assertEqual(len(running), 1)
+            runs.append(dt)
+            await asyncio.sleep(0.05)
+            running.remove(dt)
+
+        async def burst():
+            debouncer = OptimisationDebouncer(optimise, delay=0.01)
+            tasks = [asyncio.create_task(debouncer.request(_DT)) for _ in range(3)]
+            # Requests made while the first solve is running
+            await asyncio.sleep(0.03)
+            tasks += [asyncio.create_task(debouncer.request(_DT.replace(hour=12))) for _ in range(2)]
+            await asyncio.gather(*tasks)
+            return debouncer
+
+        debouncer = asyncio.run(burst())
+
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(debouncer._pending, set())
+
+    def test_failed_solve_does_not_block_the_day(self):
+        optimise = AsyncMock(side_effect=[RuntimeError("solver failed"), None])
+        debouncer = OptimisationDebouncer(optimise, delay=0)
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(debouncer.request(_DT))
+        asyncio.run(debouncer.request(_DT))
+
+        self.assertEqual(optimise.await_count, 2)
+
+
+class TestRequestHandlerOptimisation(unittest.TestCase):
+    def setUp(self):
+        patchers = [patch("app.scheduler.Database"), patch("app.scheduler.EventManager"),
+                    patch("app.scheduler.FlexEventOptimiser")]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.rh = RequestHandler()
+
+    def test_day_to_optimise_skips_days_with_nothing_to_move(self):
+        cases = [((0, 0), None), ((1, 1), None), ((3, 0), None), ((2, 1), _DT)]
+        for counts, expected in cases:
+            with self.subTest(counts=counts):
+                self.rh.db.count_events_in_date_range.return_value = counts
+                self.assertEqual(self.rh._day_to_optimise(_DT), expected)
+
+        from_dt, to_dt = self.rh.db.count_events_in_date_range.call_args.args
+        self.assertEqual((from_dt.date(), to_dt.date()), (_DT.date(), _DT.date().replace(day=6)))
+
+    def test_apply_optimised_events_only_edits_moved_events(self):
+        events = [scheduler.FixedEvent(f"Event {i}", _DT, _DT.replace(hour=10), f"id_{i}") for i in range(3)]
+        self.rh.db.event_statuses.return_value = {"id_0": scheduler.EventStatus.MODIFIED,
+                                                  "id_1": scheduler.EventStatus.UNCHANGED,
+                                                  "id_2": scheduler.EventStatus.MODIFIED}
+
+        self.rh.apply_optimised_events(events)
+
+        self.rh.db.event_statuses.assert_called_once_with(events)
+        self.rh.em.edit_events.assert_called_once_with([events[0], events[2]])
+
+
+if __name__ == '__main__':
+    unittest.main()